@@ -5,6 +5,8 @@ from .api_views_provider_objects import router as provider_objects_router
 from .api_main_views import router as main_router
 
 from .user_log import router as user_log_router
+from .profiling import router as profiling_router
+from .export import router as export_router
 
 
 api_router_v1 = APIRouter()
@@ -14,3 +16,5 @@ api_router_v1.include_router(global_objects_router, prefix="/global-objects", ta
 api_router_v1.include_router(provider_objects_router, prefix="/provider-objects", tags=["Provider Objects"])
 
 api_router_v1.include_router(user_log_router, prefix="/user-log", tags=["User Log"])
+api_router_v1.include_router(export_router, prefix="/export", tags=["Export"], include_in_schema=False)
+api_router_v1.include_router(profiling_router, prefix="/profiling", tags=["Profiling"], include_in_schema=False)
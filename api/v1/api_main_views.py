@@ -89,7 +89,7 @@ async def process_rule(session: AsyncSession, rule: TransferRule, from_currency:
                     )
                 except HTTPException as e:
                     if e.status_code == 400 and e.detail == "Unable to perform currency conversion":
-                        logger.info(f"Skipping rule {rule.id}: Unable to perform currency conversion")
+                        logger.debug("Skipping rule %s: Unable to perform currency conversion", rule.id)
                         return None
                     raise
             else:
@@ -119,7 +119,7 @@ async def process_rule(session: AsyncSession, rule: TransferRule, from_currency:
                 )
             except HTTPException as e:
                 if e.status_code == 400 and e.detail == "Unable to perform currency conversion":
-                    logger.info(f"Skipping rule {rule.id}: Unable to perform currency conversion")
+                    logger.debug("Skipping rule %s: Unable to perform currency conversion", rule.id)
                     return None
                 raise
 
@@ -151,7 +151,7 @@ async def process_rule(session: AsyncSession, rule: TransferRule, from_currency:
         )
 
     except Exception as e:
-        logger.error(f"Error processing rule {rule.id}: {str(e)}", exc_info=True)
+        logger.error("Error processing rule %s: %s", rule.id, e, exc_info=True)
         return None
 
 
@@ -172,7 +172,7 @@ async def select_best_rule(
         optional_amount: Optional[float]
 ) -> Optional[TransferRuleDetails]:
 
-    logger.info(f"Selecting best rule from {len(rules)} rules")
+    logger.debug("Selecting best rule from %d rules", len(rules))
 
     async def process_and_rank_rule(rule: TransferRule) -> Tuple[Optional[TransferRuleDetails], int]:
         from_currency = await get_cached_currency(session, from_currency_id)
@@ -182,10 +182,12 @@ async def select_best_rule(
             # Check if the converted amount is within the rule's limits
             if optional_amount is not None:
                 if result.converted_amount < rule.min_transfer_amount:
-                    logger.info(f"Rule {rule.id} skipped: amount {result.converted_amount} is less than minimum {rule.min_transfer_amount}")
+                    logger.debug("Rule %s skipped: amount %s is less than minimum %s",
+                                 rule.id, result.converted_amount, rule.min_transfer_amount)
                     return None, 3
                 if rule.max_transfer_amount is not None and result.converted_amount > rule.max_transfer_amount:
-                    logger.info(f"Rule {rule.id} skipped: amount {result.converted_amount} is greater than maximum {rule.max_transfer_amount}")
+                    logger.debug("Rule %s skipped: amount %s is greater than maximum %s",
+                                 rule.id, result.converted_amount, rule.max_transfer_amount)
                     return None, 3
 
             # Rank: 1 for single currency path, 2 for multi-currency path
@@ -202,10 +204,10 @@ async def select_best_rule(
 
     if sorted_rules:
         best_rule, _ = sorted_rules[0]
-        logger.info(f"Selected rule: {best_rule.id}")
+        logger.debug("Selected rule: %s", best_rule.id)
         return best_rule
 
-    logger.warning("No suitable rule found")
+    logger.debug("No suitable rule found")
     return None
 
 
@@ -225,7 +227,7 @@ async def get_transfer_rules(
     if not send_country_id or not receive_country_id:
         raise HTTPException(status_code=400, detail="Send country and receive country are required")
 
-    logger.info(f"Searching for transfer rules: from {send_country_id} to {receive_country_id}")
+    logger.debug("Searching for transfer rules: from %s to %s", send_country_id, receive_country_id)
 
     try:
         # Fetch all relevant data in a single query
@@ -253,11 +255,11 @@ async def get_transfer_rules(
         rules = list(result.unique().scalars().all())
 
         if not rules:
-            logger.warning(
-                f"No active transfer rules found for countries: from {send_country_id} to {receive_country_id}")
+            logger.warning("No active transfer rules found for countries: from %s to %s",
+                           send_country_id, receive_country_id)
             raise HTTPException(status_code=404, detail="No active transfer rules found for the specified countries")
 
-        logger.info(f"Found {len(rules)} transfer rules")
+        logger.debug("Found %d transfer rules", len(rules))
 
         send_country = rules[0].send_country
         receive_country = rules[0].receive_country
@@ -292,7 +294,7 @@ async def get_transfer_rules(
 
             rule_details.sort(key=calculate_fee_percentage)
 
-        logger.info(f"Returning {len(rule_details)} transfer rules")
+        logger.debug("Returning %d transfer rules", len(rule_details))
 
         # Construct and return the final response
         return OptimizedTransferRuleResponse(
@@ -303,5 +305,5 @@ async def get_transfer_rules(
         )
 
     except SQLAlchemyError as e:
-        logger.error(f"Database error: {str(e)}", exc_info=True)
+        logger.error("Database error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,10 @@
+from fastapi import HTTPException, Request
+
+
+async def admin_session_required(request: Request) -> None:
+    """
+    Allow the request only with a valid admin panel session.
+    """
+    from core.admin import is_admin_request  # Keeps sqladmin out of API-only workers until it's needed
+    if not await is_admin_request(request):
+        raise HTTPException(status_code=403, detail="Admin session required")
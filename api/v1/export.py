@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+
+from core.models import db_pools, TgUser
+from core.models.tg_logg_user import tg_users_log
+from core.services.log_compaction import readable_logs_select
+from core.services.table_export import stream_rows, csv_chunks, parquet_chunks
+from .dependencies import admin_session_required
+
+# Exports are long-running reads, they use the background pool and not the API one
+router = APIRouter(dependencies=[Depends(admin_session_required)])
+
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+LOG_COLUMNS = {
+    "id": "int", "created_at": "datetime", "repeat_count": "int", "tg_user": "str", "url_log": "str",
+    "amount": "decimal", "amount_log": "str", "currency": "str", "send_country": "str", "receive_country": "str",
+}
+USER_COLUMNS = {"id": "int", "tg_user": "str", "username": "str", "is_superuser": "bool", "created_at": "datetime"}
+
+
+def export_response(name: str, export_format: str, columns: dict[str, str], stmt) -> StreamingResponse:
+    chunks = stream_rows(db_pools.get("background").engine, stmt)
+    if export_format == "parquet":
+        body = parquet_chunks(columns, chunks)
+    else:
+        body = csv_chunks(list(columns), chunks)
+    filename = f"{name}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{export_format}"
+    return StreamingResponse(body, media_type=MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/user-logs")
+async def export_user_logs(
+        export_format: Literal["csv", "parquet"] = Query("csv", alias="format"),
+        date_from: Optional[datetime] = Query(None),
+        date_to: Optional[datetime] = Query(None),
+        send_country: Optional[str] = Query(None, description="Country code"),
+        receive_country: Optional[str] = Query(None, description="Country code"),
+        currency: Optional[str] = Query(None, description="Currency code"),
+):
+    """
+    Stream user logs as CSV or Parquet, in id (insertion) order. Date range limits the scan to the matching partitions.
+    """
+    tg_user = func.coalesce(TgUser.tg_user, tg_users_log.c.tg_user).label("tg_user")  # Not backfilled logs
+    stmt = readable_logs_select(tg_user, tg_users_log.c.url_log).outerjoin(
+        TgUser, TgUser.id == tg_users_log.c.user_id
+    )
+    if date_from is not None:
+        stmt = stmt.where(tg_users_log.c.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(tg_users_log.c.created_at < date_to)
+    subquery = stmt.subquery()
+    query = select(*(subquery.c[name] for name in LOG_COLUMNS))
+    for name, value in (("send_country", send_country), ("receive_country", receive_country),
+                        ("currency", currency)):
+        if value is not None:
+            query = query.where(subquery.c[name] == value)
+
+    return export_response("user_logs", export_format, LOG_COLUMNS,
+                           query.order_by(subquery.c.id))
+
+
+@router.get("/users")
+async def export_users(export_format: Literal["csv", "parquet"] = Query("csv", alias="format")):
+    stmt = select(*(getattr(TgUser, name) for name in USER_COLUMNS)).order_by(TgUser.id)
+    return export_response("users", export_format, USER_COLUMNS, stmt)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from core.services import slowest_requests_store
+from .dependencies import admin_session_required
+
+
+router = APIRouter(dependencies=[Depends(admin_session_required)])
+
+
+@router.get("/slowest")
+async def get_slowest_profiles():
+    return [profile.summary() for profile in slowest_requests_store.list()]
+
+
+@router.get("/slowest/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """
+    Folded stacks of a stored profile, ready for flamegraph.pl / speedscope.
+    """
+    profile = slowest_requests_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.folded)
+
+
+@router.delete("/slowest")
+async def clear_profiles():
+    slowest_requests_store.clear()
+    return {"message": "Profiles cleared"}
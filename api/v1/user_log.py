@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import ValidationError
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
 
-from core import logger
+from core import logger, settings
 from core.models import db_helper
-from core.models import TgUser, TgUserLog
-from core.schemas import TgUserCreate, TgUserLogCreate
+from core.models import tg_log_rollups, tg_log_rollup_watermark
+from core.models.tg_logg_user import tg_users_log
+from core.schemas import (
+    TgUserCreate, TgUserLogCreate, TgUserLogBulkItemStatus, TgUserLogBulkResponse,
+    CorridorDemand, CorridorDemandResponse,
+)
+from core.services import tg_user_log_ingestion, upsert_tg_user, RollupBucket, log_compactor
+from core.services.log_compaction import readable_logs_select
+from .dependencies import admin_session_required
 
 router = APIRouter()
 
@@ -15,20 +28,10 @@ router = APIRouter()
 async def create_tg_user(user: TgUserCreate, db: AsyncSession = Depends(db_helper.session_getter)):
     async with db.begin():
         try:
-            # Check if user exists
-            result = await db.execute(select(TgUser).filter(TgUser.tg_user == user.tg_user))
-            existing_user = result.scalar_one_or_none()
-
-            if existing_user:
-                logger.info(f"User {user.tg_user} already exists")
-                return existing_user
-
-            # If no user found create a new one
-            db_user = TgUser(tg_user=user.tg_user)
-            db.add(db_user)
-            await db.flush()
-            await db.refresh(db_user)
-            logger.info(f"Created new user: {user.tg_user}")
+            # Single round trip, returns the existing user if already registered
+            db_user, created = await upsert_tg_user(db, user.tg_user)
+            if created:
+                logger.info("Created new user: %s", user.tg_user)
             return db_user
         except IntegrityError:
             logger.warning(f"Integrity error when creating user {user.tg_user}")
@@ -38,29 +41,171 @@ async def create_tg_user(user: TgUserCreate, db: AsyncSession = Depends(db_helpe
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/tg-user-log")
-async def create_tg_user_log(log: TgUserLogCreate, db: AsyncSession = Depends(db_helper.session_getter)):
-    async with db.begin():
+@router.post("/tg-user-log", status_code=status.HTTP_202_ACCEPTED)
+async def create_tg_user_log(log: TgUserLogCreate):
+    """
+    Log is accepted into the ingestion queue and written in a batch later (write-behind).
+    """
+    if not tg_user_log_ingestion.submit(log.model_dump()):
+        logger.warning("User log ingestion queue is full, rejected log for user %s", log.tg_user)
+        raise HTTPException(status_code=503, detail="Log queue is full, try again later",
+                            headers={"Retry-After": "1"})
+    return {"status": "accepted"}
+
+
+@router.get("/tg-user/{user_id}/logs", name="tg_user_logs_page",
+            dependencies=[Depends(admin_session_required)], include_in_schema=False)
+async def get_tg_user_logs_page(
+        user_id: int,
+        before_id: Optional[int] = Query(None, description="Id of the last log of the previous page"),
+        limit: int = Query(50, ge=1, le=500),
+        db: AsyncSession = Depends(db_helper.session_getter),
+):
+    """
+    One page of a user's logs, newest first, for the admin user details page (keyset on id).
+    """
+    query = readable_logs_select(tg_users_log.c.url_log).where(tg_users_log.c.user_id == user_id)
+    if before_id is not None:
+        query = query.where(tg_users_log.c.id < before_id)
+    rows = (await db.execute(query.order_by(tg_users_log.c.id.desc()).limit(limit))).all()
+    return {
+        "items": [row._asdict() for row in rows],
+        "next_before_id": rows[-1].id if len(rows) == limit else None,
+    }
+
+
+@router.get("/ingestion-stats", dependencies=[Depends(admin_session_required)], include_in_schema=False)
+async def get_ingestion_stats():
+    return tg_user_log_ingestion.stats()
+
+
+def parse_bulk_body(body: bytes, content_type: str) -> list:
+    """
+    Parse JSON array or NDJSON (one record per line) body. Malformed NDJSON lines are returned
+    as exceptions, so they get their own status instead of failing the whole request.
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError as e:
+                records.append(e)
+        return records
+
+    try:
+        records = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Malformed JSON body")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="JSON array of logs expected")
+    return records
+
+
+@router.post("/tg-user-log/bulk", response_model=TgUserLogBulkResponse)
+async def create_tg_user_logs_bulk(request: Request, db: AsyncSession = Depends(db_helper.session_getter)):
+    """
+    Create many logs at once. Body is a JSON array of logs or NDJSON (`Content-Type: application/x-ndjson`).
+    Valid logs of known users are written with a single multi-row INSERT, the response has a status per record.
+    """
+    records = parse_bulk_body(await request.body(), request.headers.get("content-type", ""))
+    if len(records) > settings.log_ingestion.bulk_max_records:
+        raise HTTPException(status_code=413,
+                            detail=f"Too many logs, max {settings.log_ingestion.bulk_max_records} per request")
+
+    items: list[TgUserLogBulkItemStatus | None] = [None] * len(records)
+    valid: list[tuple[int, TgUserLogCreate]] = []
+    for index, record in enumerate(records):
+        if isinstance(record, Exception):
+            items[index] = TgUserLogBulkItemStatus(index=index, status="invalid", errors=["Malformed JSON"])
+            continue
         try:
-            # Create a log
-            db_log = TgUserLog(
-                tg_user=log.tg_user,
-                url_log=log.url_log,
-                amount_log=log.amount_log,
-                currency_log=log.currency_log,
-                send_country_log=log.send_country_log,
-                receive_country_log=log.receive_country_log
-            )
-            db.add(db_log)
-
-            await db.flush()
-            await db.refresh(db_log)
-            logger.info(f"Created log for user {log.tg_user}")
-            return db_log
+            valid.append((index, TgUserLogCreate.model_validate(record)))
+        except ValidationError as e:
+            errors = [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+            items[index] = TgUserLogBulkItemStatus(index=index, status="invalid", errors=errors)
 
-        except IntegrityError:
-            logger.warning(f"Integrity error when creating log for user {log.tg_user}")
-            raise HTTPException(status_code=400, detail="Error creating log")
-        except Exception as e:
-            logger.error(f"Error creating log for user {log.tg_user}: {str(e)}")
-            raise HTTPException(status_code=500, detail="Internal server error")
+    created = 0
+    if valid:
+        async with db.begin():
+            created_at = datetime.now(timezone.utc)
+            entries = [{**log.model_dump(), "created_at": created_at} for _, log in valid]
+            # One SELECT for the users, values converted to the typed columns
+            rows, unknown = await log_compactor.compact(db, entries)
+            unknown = set(unknown)
+            for position, (index, log) in enumerate(valid):
+                if position in unknown:
+                    items[index] = TgUserLogBulkItemStatus(index=index, status="unknown_user",
+                                                           errors=[f"User {log.tg_user} not found"])
+                else:
+                    items[index] = TgUserLogBulkItemStatus(index=index, status="created")
+            if rows:
+                await db.execute(insert(tg_users_log).values(rows))
+                created = len(rows)
+
+    logger.debug("Bulk logs: %d created, %d rejected", created, len(records) - created)
+    return TgUserLogBulkResponse(created=created, rejected=len(records) - created, items=items)
+
+
+@router.get("/corridor-demand", response_model=CorridorDemandResponse)
+async def get_corridor_demand(
+        granularity: Literal["hour", "day"] = Query("day", description="Rollup buckets to read"),
+        date_from: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+        date_to: Optional[datetime] = Query(None, description="Default: now"),
+        send_country: Optional[str] = Query(None),
+        receive_country: Optional[str] = Query(None),
+        currency: Optional[str] = Query(None),
+        per_bucket: bool = Query(False, description="Return every bucket instead of totals per corridor"),
+        limit: int = Query(20, gt=0, le=1000),
+        db: AsyncSession = Depends(db_helper.session_getter)
+):
+    """
+    Most searched corridors and typical amounts, served from the pre-aggregated rollups (not from raw logs).
+    """
+    date_to = date_to or datetime.now(timezone.utc)
+    date_from = date_from or date_to - timedelta(days=30)
+
+    query = select(tg_log_rollups).where(
+        tg_log_rollups.c.granularity == granularity,
+        tg_log_rollups.c.bucket_start >= date_from,
+        tg_log_rollups.c.bucket_start < date_to,
+    )
+    for column, value in ((tg_log_rollups.c.send_country, send_country),
+                          (tg_log_rollups.c.receive_country, receive_country),
+                          (tg_log_rollups.c.currency, currency)):
+        if value is not None:
+            query = query.where(column == value)
+
+    rows = (await db.execute(query)).all()
+    watermark_at = (await db.execute(
+        select(tg_log_rollup_watermark.c.updated_at).where(tg_log_rollup_watermark.c.id == 1)
+    )).scalar_one_or_none()
+
+    buckets: dict[tuple, RollupBucket] = {}
+    for row in rows:
+        key = (row.send_country, row.receive_country, row.currency, row.bucket_start if per_bucket else None)
+        buckets.setdefault(key, RollupBucket()).merge(RollupBucket(row))
+
+    items = [
+        CorridorDemand(
+            send_country=key[0], receive_country=key[1], currency=key[2], bucket_start=key[3],
+            count=bucket.count,
+            amount_count=bucket.amount_count,
+            amount_avg=round(bucket.amount_sum / bucket.amount_count, 2) if bucket.amount_count else None,
+            amount_min=bucket.amount_min,
+            amount_max=bucket.amount_max,
+            amount_p50=bucket.sketch.quantile(0.5),
+            amount_p90=bucket.sketch.quantile(0.9),
+            amount_p99=bucket.sketch.quantile(0.99),
+        )
+        for key, bucket in buckets.items()
+    ]
+    if per_bucket:
+        items.sort(key=lambda x: (x.bucket_start, -x.count))
+    else:
+        items.sort(key=lambda x: -x.count)
+
+    return CorridorDemandResponse(granularity=granularity, date_from=date_from, date_to=date_to,
+                                  watermark_at=watermark_at, items=items[:limit])
@@ -3,6 +3,7 @@ import logging
 from pythonjsonlogger import jsonlogger
 
 from core import settings
+from utils import make_queue_handler
 
 
 # Setup logging
@@ -22,9 +23,16 @@ def setup_logging() -> logging.Logger:
     )
     stream_handler.setFormatter(stream_formatter)
 
+    queue_handler = make_queue_handler(
+        stream_handler,
+        queue_size=settings.logging.queue_size,
+        sample_limit=settings.logging.sample_limit,
+        sample_interval=settings.logging.sample_interval_sec,
+    )
+
     new_logger = logging.getLogger("BOT")
     new_logger.setLevel(log_level)
-    new_logger.addHandler(stream_handler)
+    new_logger.addHandler(queue_handler)
 
     return new_logger
 
@@ -0,0 +1,192 @@
+"""
+Concurrent broadcast sending: a pool of sender tasks shares a global token bucket (messages per second for the
+whole bot) and a per-chat limiter (min interval between messages to one chat). On `RetryAfter` all senders pause
+for the requested time and the rate is cut in half, then it grows back to the target while sends succeed.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter
+
+from bot.bot_logger import logger
+
+
+class TokenBucket:
+    """
+    Async token bucket, `rate` tokens per second with bursts up to `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatLimiter:
+    """
+    Min interval between messages to the same chat.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_at: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_at = self._next_at.get(chat_id, 0.0)
+        self._next_at[chat_id] = max(now, next_at) + self.interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    def forget(self, chat_id: int) -> None:
+        self._next_at.pop(chat_id, None)
+
+
+def classify_failure(error: Exception) -> str:
+    """
+    :return: "blocked", "deactivated", "not_found" - the chat is unreachable until the user writes to the bot,
+        "transient" - worth retrying in the next broadcast
+    """
+    message = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        return "deactivated" if "deactivated" in message else "blocked"
+    if isinstance(error, TelegramNotFound) or (isinstance(error, TelegramBadRequest) and "chat not found" in message):
+        return "not_found"
+    return "transient"
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: list[int] = field(default_factory=list)
+    retries: int = 0
+    elapsed: float = 0.0
+
+
+# Sends one broadcast message to a chat, `send(chat_id, message)` -> API call
+SendFunc = Callable[[int, object], Awaitable[object]]
+
+
+class BroadcastEngine:
+    """
+    :param target_rate: Messages per second for the whole bot
+    :param concurrency: Number of sender tasks
+    :param chat_interval: Seconds between messages to the same chat
+    :param max_retries: `RetryAfter` retries of one message before the chat is counted as failed
+    """
+    def __init__(self, target_rate: float, concurrency: int, chat_interval: float, max_retries: int = 5):
+        self.target_rate = target_rate
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate=target_rate, capacity=max(1.0, target_rate))
+        self.chat_limiter = ChatLimiter(chat_interval)
+
+    def set_target_rate(self, rate: float) -> None:
+        """
+        Change the target, e.g. to this worker's share of the rate of all bot workers.
+        """
+        self.target_rate = rate
+        self.bucket.capacity = max(1.0, rate)
+        self.bucket.rate = min(self.bucket.rate, rate)
+
+    def _on_retry_after(self, seconds: float) -> None:
+        self.bucket.pause(seconds)
+        self.bucket.rate = max(1.0, self.bucket.rate / 2)
+        logger.warning("Broadcast hit flood control, pause %s s, rate lowered to %.1f msg/s", seconds, self.bucket.rate)
+
+    def _on_success(self) -> None:
+        if self.bucket.rate < self.target_rate:
+            self.bucket.rate = min(self.target_rate, self.bucket.rate + 0.1)
+
+    async def send(self, chat_id: int, messages: Iterable, send: SendFunc, result: BroadcastResult) -> None:
+        """
+        Send all messages to one chat, retrying on `RetryAfter`.
+        """
+        for message in messages:
+            for attempt in range(self.max_retries + 1):
+                await self.chat_limiter.wait(chat_id)
+                await self.bucket.acquire()
+                try:
+                    await send(chat_id, message)
+                    self._on_success()
+                    break
+                except TelegramRetryAfter as e:
+                    result.retries += 1
+                    self._on_retry_after(e.retry_after)
+                    if attempt == self.max_retries:
+                        raise
+
+    async def run(
+            self,
+            chat_ids: AsyncIterable[int] | Iterable[int],
+            messages: list,
+            send: SendFunc,
+            on_done: Callable[[int, Exception | None], Awaitable[None]] | None = None,
+    ) -> BroadcastResult:
+        """
+        Send `messages` to every chat of `chat_ids` with `concurrency` senders.
+
+        :param on_done: Called after every chat with (chat_id, error), error is None when it was sent
+        """
+        result = BroadcastResult()
+        started = time.monotonic()
+        queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def sender() -> None:
+            while (chat_id := await queue.get()) is not None:
+                error = None
+                try:
+                    await self.send(chat_id, messages, send, result)
+                    result.sent += 1
+                except Exception as e:
+                    logger.info("Failed to send broadcast to user %s: %s", chat_id, e)
+                    result.failed.append(chat_id)
+                    error = e
+                self.chat_limiter.forget(chat_id)
+                if on_done is not None:
+                    # A failed callback (e.g. checkpoint write) must not kill the sender, the producer would wait
+                    # for a free queue slot forever once all of them are gone
+                    try:
+                        await on_done(chat_id, error)
+                    except Exception as e:
+                        logger.exception(f"Error in broadcast on_done for user {chat_id}: {e}")
+
+        senders = [asyncio.create_task(sender()) for _ in range(self.concurrency)]
+        try:
+            if isinstance(chat_ids, AsyncIterable):
+                async for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            else:
+                for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            for _ in senders:
+                await queue.put(None)
+            await asyncio.gather(*senders)
+        finally:
+            for task in senders:
+                task.cancel()
+
+        result.elapsed = time.monotonic() - started
+        return result
@@ -0,0 +1,377 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import and_, func, insert, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.bot_logger import logger
+from bot.broadcast import BroadcastEngine, classify_failure
+from bot.broadcast_payload import plan_steps
+from bot.cache import bot_cache
+from core.models import TgUser, broadcast_jobs, broadcast_recipients, broadcast_job_items
+
+
+# Sends one step of the broadcast plan, `send(bot, chat_id, step)`
+JobSendFunc = Callable[[Bot, int, dict], Awaitable[object]]
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class BroadcastJobRunner:
+    """
+    Runs broadcast jobs in background tasks, any number of bot workers can run the same job.
+    Recipients are split into batches (`broadcast_job_items`); a worker leases one batch at a time with
+    `FOR UPDATE SKIP LOCKED` (plus one of prefetch), marks its recipients "sending" before they are sent and renews
+    its leases every `poll_interval`. A lease not renewed for `lease_time` (the worker died) is taken over by another
+    worker, recipients left in "sending" are marked "unknown" and not sent again, so nobody gets a broadcast twice.
+    Workers holding leases share `global_rate` equally.
+    Results are checkpointed and the progress message in the admin chat is edited every `checkpoint_interval` seconds.
+    """
+    def __init__(self, engine: AsyncEngine, broadcast_engine: BroadcastEngine, send: JobSendFunc,
+                 batch_size: int, checkpoint_interval: float, global_rate: float,
+                 lease_time: float, poll_interval: float):
+        self.engine = engine
+        self.broadcast_engine = broadcast_engine
+        self.send = send
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.global_rate = global_rate
+        self.lease_time = lease_time
+        self.poll_interval = poll_interval
+        self.worker_id = _worker_id()
+        self._tasks: dict[int, asyncio.Task] = {}
+        # (job_id, batch_no) leased by this worker
+        self._leases: set[tuple[int, int]] = set()
+        self._worker_task: asyncio.Task | None = None
+
+    async def create_job(self, created_by: str, refs: list[dict], status_message: types.Message) -> int:
+        """
+        Store the job (message references, see `bot.broadcast_payload`) with every reachable user
+        as a pending recipient, numbered into batches (one INSERT ... SELECT).
+        """
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                insert(broadcast_jobs).values(
+                    created_by=created_by, payload=refs,
+                    status_chat_id=status_message.chat.id, status_message_id=status_message.message_id,
+                ).returning(broadcast_jobs.c.id)
+            )
+            job_id = result.scalar_one()
+            batch_no = (func.row_number().over(order_by=TgUser.tg_user) - 1) // self.batch_size
+            result = await conn.execute(
+                insert(broadcast_recipients).from_select(
+                    ["job_id", "tg_user", "batch_no"],
+                    select(literal(job_id), TgUser.tg_user, batch_no).where(TgUser.status == "active")
+                )
+            )
+            total = result.rowcount
+            if total:
+                await conn.execute(
+                    insert(broadcast_job_items).from_select(
+                        ["job_id", "batch_no"],
+                        select(literal(job_id), func.generate_series(0, (total - 1) // self.batch_size))
+                    )
+                )
+            await conn.execute(update(broadcast_jobs).where(broadcast_jobs.c.id == job_id).values(total=total))
+        return job_id
+
+    def start(self, bot: Bot, job_id: int) -> None:
+        if job_id not in self._tasks:
+            self._tasks[job_id] = asyncio.create_task(self._run_job(bot, job_id))
+            self._tasks[job_id].add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def run(self, bot: Bot) -> None:
+        """
+        Worker loop: renews the leases of this worker, sets its share of the global rate and starts the jobs
+        that have batches to send (new ones, or leases of a dead worker expired).
+        """
+        self._worker_task = asyncio.current_task()
+        logger.info("Broadcast worker %s started", self.worker_id)
+        while True:
+            try:
+                await self._renew_leases()
+                for job_id in await self._jobs_to_run():
+                    if job_id not in self._tasks:
+                        logger.warning("Picking up broadcast job %s", job_id)
+                        self.start(bot, job_id)
+            except Exception as e:
+                logger.exception(f"Error in broadcast worker loop: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        if self._worker_task is not None:
+            tasks.append(self._worker_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _renew_leases(self) -> None:
+        held = set(self._leases)
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(broadcast_job_items)
+                .where(broadcast_job_items.c.lease_owner == self.worker_id, broadcast_job_items.c.status == "leased")
+                .values(lease_until=func.now() + timedelta(seconds=self.lease_time))
+                .returning(broadcast_job_items.c.job_id, broadcast_job_items.c.batch_no)
+            )
+            renewed = {tuple(row) for row in result.all()}
+            result = await conn.execute(
+                select(broadcast_job_items.c.lease_owner.distinct())
+                .where(broadcast_job_items.c.status == "leased", broadcast_job_items.c.lease_until > func.now())
+            )
+            owners = set(result.scalars().all())
+
+        lost = held - renewed
+        if lost:
+            logger.warning("Broadcast worker %s lost the leases of %s batches", self.worker_id, len(lost))
+            self._leases.difference_update(lost)
+        # A worker without leases counts itself, it's about to lease a batch or idle
+        workers = len(owners | {self.worker_id})
+        self.broadcast_engine.set_target_rate(max(1.0, self.global_rate / workers))
+
+    async def _jobs_to_run(self) -> list[int]:
+        items = broadcast_job_items
+        leasable = select(items.c.batch_no).where(
+            items.c.job_id == broadcast_jobs.c.id,
+            or_(items.c.status == "pending", and_(items.c.status == "leased", items.c.lease_until < func.now())),
+        ).exists()
+        unfinished = select(items.c.batch_no).where(items.c.job_id == broadcast_jobs.c.id,
+                                                    items.c.status != "done").exists()
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(broadcast_jobs.c.id).where(broadcast_jobs.c.status == "running", or_(leasable, ~unfinished))
+            )
+            return list(result.scalars().all())
+
+    async def _lease_batch(self, job_id: int) -> tuple[int, list[str]] | None:
+        """
+        Lease the next free batch of the job (pending, or its lease expired) and mark its pending recipients "sending".
+
+        :return: Batch number and the claimed chat ids, None when there are no free batches
+        """
+        items, recipients = broadcast_job_items, broadcast_recipients
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                select(items.c.batch_no)
+                .where(items.c.job_id == job_id,
+                       or_(items.c.status == "pending",
+                           and_(items.c.status == "leased", items.c.lease_until < func.now())))
+                .order_by(items.c.batch_no)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            batch_no = result.scalar_one_or_none()
+            if batch_no is None:
+                return None
+            await conn.execute(
+                update(items).where(items.c.job_id == job_id, items.c.batch_no == batch_no).values(
+                    status="leased", lease_owner=self.worker_id,
+                    lease_until=func.now() + timedelta(seconds=self.lease_time), updated_at=func.now(),
+                )
+            )
+            in_batch = (recipients.c.job_id == job_id, recipients.c.batch_no == batch_no)
+            # Left by a worker that died or lost the lease, they may have got the message
+            await conn.execute(
+                update(recipients).where(*in_batch, recipients.c.status == "sending")
+                .values(status="unknown", updated_at=func.now())
+            )
+            result = await conn.execute(
+                update(recipients).where(*in_batch, recipients.c.status == "pending")
+                .values(status="sending", updated_at=func.now())
+                .returning(recipients.c.tg_user)
+            )
+            chat_ids = sorted(result.scalars().all())
+        self._leases.add((job_id, batch_no))
+        return batch_no, chat_ids
+
+    async def _recipients(self, job_id: int, claimed: set[str]) -> AsyncIterator[int]:
+        """
+        Recipients of the job, leased batch by batch while the previous batch is being sent
+        (one batch of prefetch), so the senders never wait for the database and memory doesn't grow with the job.
+        Stops at the end of the free batches, the batches of other workers are theirs to finish.
+
+        :param claimed: Filled with the claimed chat ids
+        """
+        next_batch = asyncio.create_task(self._lease_batch(job_id))
+        try:
+            while (leased := await next_batch) is not None:
+                batch_no, batch = leased
+                claimed.update(batch)
+                next_batch = asyncio.create_task(self._lease_batch(job_id))
+                for chat_id in batch:
+                    if (job_id, batch_no) not in self._leases:
+                        # Taken over by another worker, the rest of the batch is "unknown" now
+                        break
+                    yield int(chat_id)
+        finally:
+            if next_batch.done() and not next_batch.cancelled() and next_batch.exception() is None \
+                    and next_batch.result() is not None:
+                claimed.update(next_batch.result()[1])
+            else:
+                next_batch.cancel()
+
+    async def _checkpoint(self, job_id: int, results: dict[str, list[str]],
+                          failures: dict[str, list[str]] | None = None, release: bool = False) -> None:
+        """
+        Store the results, mark the leased batches without recipients in progress done.
+
+        :param results: Chat ids by their new status
+        :param failures: Failed chat ids by the failure reason (`classify_failure`), unreachable users get it
+            as their status and are left out of the next broadcasts
+        :param release: Give the batches still leased by this worker back to the other workers
+        """
+        items, recipients = broadcast_job_items, broadcast_recipients
+        async with self.engine.begin() as conn:
+            for reason, chat_ids in (failures or {}).items():
+                await conn.execute(
+                    update(recipients).where(recipients.c.job_id == job_id, recipients.c.tg_user.in_(chat_ids))
+                    .values(error=reason)
+                )
+                values = {"last_failure_at": func.now(), "last_failure_reason": reason}
+                if reason != "transient":
+                    values["status"] = reason
+                    # Registered again by their next /start
+                    bot_cache.users.forget(chat_ids)
+                await conn.execute(update(TgUser.__table__).where(TgUser.tg_user.in_(chat_ids)).values(**values))
+            for status, chat_ids in results.items():
+                if chat_ids:
+                    stmt = update(recipients).where(recipients.c.job_id == job_id, recipients.c.tg_user.in_(chat_ids))
+                    if status == "pending":
+                        # Not if the batch was taken over, they are "unknown" then
+                        stmt = stmt.where(recipients.c.status == "sending")
+                    await conn.execute(stmt.values(status=status, updated_at=func.now()))
+            await conn.execute(
+                update(broadcast_jobs).where(broadcast_jobs.c.id == job_id).values(
+                    sent=broadcast_jobs.c.sent + len(results.get("sent", [])),
+                    failed=broadcast_jobs.c.failed + len(results.get("failed", [])),
+                    updated_at=func.now(),
+                )
+            )
+
+            own = (items.c.job_id == job_id, items.c.lease_owner == self.worker_id, items.c.status == "leased")
+            in_progress = select(recipients.c.tg_user).where(
+                recipients.c.job_id == items.c.job_id, recipients.c.batch_no == items.c.batch_no,
+                recipients.c.status.in_(("pending", "sending")),
+            ).exists()
+            result = await conn.execute(
+                update(items).where(*own, ~in_progress).values(status="done", updated_at=func.now())
+                .returning(items.c.batch_no)
+            )
+            finished = result.scalars().all()
+            released = []
+            if release:
+                result = await conn.execute(
+                    update(items).where(*own)
+                    .values(status="pending", lease_owner=None, lease_until=None, updated_at=func.now())
+                    .returning(items.c.batch_no)
+                )
+                released = result.scalars().all()
+        self._leases.difference_update((job_id, batch_no) for batch_no in [*finished, *released])
+
+    async def _finish(self, job_id: int) -> bool:
+        """
+        Mark the job done if all its batches are.
+
+        :return: True for the one worker that finished it
+        """
+        unfinished = select(broadcast_job_items.c.batch_no).where(
+            broadcast_job_items.c.job_id == job_id, broadcast_job_items.c.status != "done"
+        ).exists()
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(broadcast_jobs)
+                .where(broadcast_jobs.c.id == job_id, broadcast_jobs.c.status == "running", ~unfinished)
+                .values(status="done", finished_at=func.now(), updated_at=func.now())
+                .returning(broadcast_jobs.c.id)
+            )
+            return result.first() is not None
+
+    async def _report(self, bot: Bot, job_id: int, finished: bool = False) -> None:
+        async with self.engine.connect() as conn:
+            job = (await conn.execute(select(broadcast_jobs).where(broadcast_jobs.c.id == job_id))).one()
+        if job.status_chat_id is None:
+            return
+        done = job.sent + job.failed
+        if finished:
+            text = (f"Рассылка #{job_id} завершена: отправлено {job.sent} из {job.total}, "
+                    f"не удалось отправить {job.failed} пользователям.")
+        else:
+            text = f"Рассылка #{job_id}: {done} из {job.total} (отправлено {job.sent}, ошибок {job.failed})."
+        try:
+            await bot.edit_message_text(text, chat_id=job.status_chat_id, message_id=job.status_message_id)
+        except TelegramBadRequest as e:
+            logger.debug("Can't edit progress of broadcast job %s: %s", job_id, e)
+
+    async def _run_job(self, bot: Bot, job_id: int) -> None:
+        async with self.engine.connect() as conn:
+            payload = (await conn.execute(select(broadcast_jobs.c.payload)
+                                          .where(broadcast_jobs.c.id == job_id))).scalar_one()
+        steps = plan_steps(payload)
+        checkpoint_at = time.monotonic() + self.checkpoint_interval
+
+        # Only chats in progress are kept: claimed and not done yet, attempted (first API call made) and not done yet
+        claimed: set[str] = set()
+        attempted: set[str] = set()
+        results: dict[str, list[str]] = {"sent": [], "failed": []}
+        failures: dict[str, list[str]] = {}
+
+        async def send(chat_id: int, step: dict):
+            attempted.add(str(chat_id))
+            return await self.send(bot, chat_id, step)
+
+        async def on_done(chat_id: int, error: Exception | None) -> None:
+            nonlocal results, failures, checkpoint_at
+            claimed.discard(str(chat_id))
+            attempted.discard(str(chat_id))
+            if error is None:
+                results["sent"].append(str(chat_id))
+            else:
+                results["failed"].append(str(chat_id))
+                failures.setdefault(classify_failure(error), []).append(str(chat_id))
+            if time.monotonic() >= checkpoint_at:
+                checkpoint, results = results, {"sent": [], "failed": []}
+                checkpoint_failures, failures = failures, {}
+                checkpoint_at = time.monotonic() + self.checkpoint_interval
+                try:
+                    await self._checkpoint(job_id, checkpoint, checkpoint_failures)
+                except Exception:
+                    # Kept for the next checkpoint
+                    for status, chat_ids in checkpoint.items():
+                        results[status].extend(chat_ids)
+                    for reason, chat_ids in checkpoint_failures.items():
+                        failures.setdefault(reason, []).extend(chat_ids)
+                    raise
+                await self._report(bot, job_id)
+
+        recipients = self._recipients(job_id, claimed)
+        try:
+            try:
+                await self.broadcast_engine.run(recipients, steps, send, on_done)
+            finally:
+                await recipients.aclose()  # Counts the prefetched batch in `claimed`
+                # Stopped in the middle: not started recipients go back to pending, started ones are unknown
+                results["pending"] = [chat_id for chat_id in claimed if chat_id not in attempted]
+                results["unknown"] = list(attempted)
+                await asyncio.shield(self._checkpoint(job_id, results, failures, release=True))
+
+            # Other workers may still be sending their batches, the last one to finish reports
+            if await self._finish(job_id):
+                await self._report(bot, job_id, finished=True)
+                logger.warning("Broadcast job %s finished", job_id)
+            else:
+                await self._report(bot, job_id)
+        except asyncio.CancelledError:
+            logger.warning("Broadcast job %s stopped, its batches are released to the other workers", job_id)
+            raise
+        except Exception as e:
+            logger.exception(f"Error in broadcast job {job_id}: {e}")
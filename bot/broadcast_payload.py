@@ -0,0 +1,91 @@
+"""
+Broadcast payload: references to the messages the admin sent to the bot (source chat id and message id),
+delivered with `copy_message(s)`, so FSM state and jobs hold a few numbers per message instead of whole messages.
+Photos and videos also keep their file id and caption: two or more in a row are sent as one media group.
+Every step of the plan is one API call per recipient.
+"""
+
+from aiogram import Bot, types
+from aiogram.enums import ContentType
+
+MEDIA_GROUP_TYPES = {
+    ContentType.PHOTO: types.InputMediaPhoto,
+    ContentType.VIDEO: types.InputMediaVideo,
+}
+# Bot API limits
+MEDIA_GROUP_MAX_SIZE = 10
+COPY_MESSAGES_MAX_SIZE = 100
+
+
+def message_ref(message: types.Message) -> dict:
+    ref = {"chat_id": message.chat.id, "message_id": message.message_id}
+    if message.content_type == ContentType.PHOTO:
+        ref.update(media=ContentType.PHOTO.value, file_id=message.photo[-1].file_id)
+    elif message.content_type == ContentType.VIDEO:
+        ref.update(media=ContentType.VIDEO.value, file_id=message.video.file_id)
+    else:
+        return ref
+    if message.caption:
+        ref["caption"] = message.caption
+    if message.caption_entities:
+        ref["caption_entities"] = [entity.model_dump(mode="json", exclude_none=True)
+                                   for entity in message.caption_entities]
+    return ref
+
+
+def _legacy_ref(item: dict) -> dict:
+    # Jobs created before the references stored the whole message
+    message = item["message"]
+    return {"chat_id": message["chat"]["id"], "message_id": message["message_id"]}
+
+
+def plan_steps(refs: list[dict]) -> list[dict]:
+    """
+    Group the references into API calls: `{"media_group": [refs]}` for `send_media_group`,
+    `{"from_chat_id": ..., "message_ids": [...]}` for `copy_message(s)`.
+    """
+    refs = [_legacy_ref(ref) if "message" in ref else ref for ref in refs]
+
+    # Runs of photos and videos, two or more make media groups
+    grouped: list[dict] = []
+    i = 0
+    while i < len(refs):
+        j = i
+        while j < len(refs) and refs[j].get("media"):
+            j += 1
+        if j - i < 2:
+            grouped.append(refs[i])
+            i += 1
+            continue
+        for start in range(i, j, MEDIA_GROUP_MAX_SIZE):
+            chunk = refs[start:min(j, start + MEDIA_GROUP_MAX_SIZE)]
+            grouped.extend(chunk if len(chunk) == 1 else [{"media_group": chunk}])
+        i = j
+
+    # Consecutive copies from one chat, message ids must be increasing
+    steps: list[dict] = []
+    for ref in grouped:
+        last = steps[-1] if steps else None
+        if "media_group" in ref:
+            steps.append(ref)
+        elif (last is not None and last.get("from_chat_id") == ref["chat_id"]
+              and last["message_ids"][-1] < ref["message_id"]
+              and len(last["message_ids"]) < COPY_MESSAGES_MAX_SIZE):
+            last["message_ids"].append(ref["message_id"])
+        else:
+            steps.append({"from_chat_id": ref["chat_id"], "message_ids": [ref["message_id"]]})
+    return steps
+
+
+async def send_step(bot: Bot, chat_id: int, step: dict):
+    """
+    Send one step of the plan to a chat.
+    """
+    if "media_group" in step:
+        media = [MEDIA_GROUP_TYPES[ContentType(ref["media"])](
+            media=ref["file_id"], caption=ref.get("caption"), caption_entities=ref.get("caption_entities"),
+        ) for ref in step["media_group"]]
+        return await bot.send_media_group(chat_id, media)
+    if len(step["message_ids"]) == 1:
+        return await bot.copy_message(chat_id, step["from_chat_id"], step["message_ids"][0])
+    return await bot.copy_messages(chat_id, step["from_chat_id"], step["message_ids"])
@@ -0,0 +1,106 @@
+"""
+In-memory state of the bot process, so repeat interactions don't touch the database: users known to be registered
+with their current username, the superusers and the welcome message. All of it is per process and bounded in time,
+changes made by other processes (admin panel, other bot workers) are seen after the TTL.
+"""
+
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import settings
+from core.models import TgUser, WelcomeMessage
+
+
+class UserCache:
+    """
+    LRU of users registered with the given username in the last `ttl` seconds, at most `max_size` users.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: OrderedDict[str, tuple[float, str | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def is_known(self, tg_user: str, username: str | None) -> bool:
+        cached = self._users.get(tg_user)
+        if cached is None or cached[1] != username or cached[0] < time.monotonic():
+            return False
+        self._users.move_to_end(tg_user)
+        return True
+
+    def add(self, tg_user: str, username: str | None) -> None:
+        self._users[tg_user] = (time.monotonic() + self.ttl, username)
+        self._users.move_to_end(tg_user)
+        if len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def forget(self, tg_users: list[str]) -> None:
+        for tg_user in tg_users:
+            self._users.pop(tg_user, None)
+
+
+class SuperuserCache:
+    """
+    Set of the superusers, reloaded every `ttl` seconds. An unknown user reloads it right away (at most once in
+    `miss_interval` seconds), so a newly promoted admin doesn't wait for the TTL.
+    """
+    def __init__(self, ttl: float, miss_interval: float = 5):
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self._superusers: frozenset[str] = frozenset()
+        self._loaded_at: float | None = None
+
+    def is_cached(self, tg_user: str) -> bool:
+        """
+        Check without the database, False until the set is loaded.
+        """
+        return tg_user in self._superusers
+
+    async def _load(self, session: AsyncSession) -> None:
+        result = await session.execute(select(TgUser.tg_user).where(TgUser.is_superuser.is_(True)))
+        self._superusers = frozenset(result.scalars().all())
+        self._loaded_at = time.monotonic()
+
+    async def contains(self, session: AsyncSession, tg_user: str) -> bool:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            await self._load(session)
+        elif tg_user not in self._superusers and time.monotonic() - self._loaded_at >= self.miss_interval:
+            await self._load(session)
+        return tg_user in self._superusers
+
+
+class WelcomeMessageCache:
+    """
+    The welcome message text, reloaded every `ttl` seconds.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._text: str | None = None
+        self._loaded_at = 0.0
+
+    async def get(self, session: AsyncSession) -> str:
+        if self._text is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._text = await WelcomeMessage.get_message(session)
+            self._loaded_at = time.monotonic()
+        return self._text
+
+
+class BotCache:
+    def __init__(self, user_cache_size: int, user_cache_ttl: float, superuser_cache_ttl: float,
+                 welcome_message_ttl: float):
+        self.users = UserCache(max_size=user_cache_size, ttl=user_cache_ttl)
+        self.superusers = SuperuserCache(ttl=superuser_cache_ttl)
+        self.welcome_message = WelcomeMessageCache(ttl=welcome_message_ttl)
+
+
+bot_cache = BotCache(
+    user_cache_size=settings.bot.user_cache_size,
+    user_cache_ttl=settings.bot.user_cache_sec,
+    superuser_cache_ttl=settings.bot.superuser_cache_sec,
+    welcome_message_ttl=settings.bot.welcome_message_cached_time,
+)
@@ -0,0 +1,192 @@
+"""
+Local fake Telegram Bot API server for integration and throughput tests of the bot, no real Telegram involved.
+Run it with `python -m bot.fake_bot_api` and start the bot with `TGBOT_API_URL=http://localhost:8090`.
+
+- Sending methods answer like Telegram, with optional latency, a global flood limit (429 with `retry_after`)
+  and chats that "blocked the bot" (403).
+- `setWebhook` is remembered, `POST /_fake/updates?count=1000&concurrency=50` then posts that many /start updates
+  from different users to the webhook (with the secret token) and reports the latency.
+- `GET /_fake/stats` shows the calls by method.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+
+
+class FakeBotAPI:
+    """
+    :param latency: Seconds before every answer
+    :param rate: Sending calls per second over which 429 is answered, 0 - no limit
+    :param blocked_every: Chats with id divisible by it answer 403, 0 - nobody blocked the bot
+    """
+    def __init__(self, latency: float, rate: float, blocked_every: int):
+        self.latency = latency
+        self.rate = rate
+        self.blocked_every = blocked_every
+        self.webhook: dict = {}
+        self.calls: Counter[str] = Counter()
+        self.errors: Counter[int] = Counter()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._window_started = time.monotonic()
+        self._window_calls = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        app.router.add_post("/_fake/updates", self.handle_generate_updates)
+        app.router.add_get("/_fake/stats", self.handle_stats)
+        return app
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _error(self, code: int, description: str, **parameters) -> web.Response:
+        self.errors[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    def _flood_limited(self) -> bool:
+        if not self.rate:
+            return False
+        now = time.monotonic()
+        if now - self._window_started >= 1:
+            self._window_started, self._window_calls = now, 0
+        self._window_calls += 1
+        return self._window_calls > self.rate
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, **fields}
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        # aiogram sends complex values JSON encoded
+        for name, value in params.items():
+            if isinstance(value, str) and value[:1] in "[{":
+                try:
+                    params[name] = json.loads(value)
+                except ValueError:
+                    pass
+        return params
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await self._params(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method == "setWebhook":
+            self.webhook = {"url": params.get("url"), "secret_token": params.get("secret_token")}
+            return self._ok(True)
+        if method == "deleteWebhook":
+            self.webhook = {}
+            return self._ok(True)
+        if method == "getWebhookInfo":
+            return self._ok({"url": self.webhook.get("url", ""), "has_custom_certificate": False,
+                             "pending_update_count": 0})
+        if method == "getUpdates":
+            await asyncio.sleep(min(float(params.get("timeout", 0)), 1))
+            return self._ok([])
+
+        chat_id = int(params.get("chat_id", 0))
+        if method.startswith(("send", "copy", "forward")):
+            if self._flood_limited():
+                return self._error(429, "Too Many Requests: retry after 1", retry_after=1)
+            if self.blocked_every and chat_id % self.blocked_every == 0:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+
+        if method == "copyMessage":
+            return self._ok({"message_id": next(self._message_ids)})
+        if method in ("copyMessages", "forwardMessages"):
+            return self._ok([{"message_id": next(self._message_ids)} for _ in params.get("message_ids", [])])
+        if method == "sendMediaGroup":
+            return self._ok([self._message(chat_id, caption=media.get("caption"))
+                             for media in params.get("media", [])])
+        if method in ("sendMessage", "editMessageText"):
+            return self._ok(self._message(chat_id, text=params.get("text", "")))
+        if method.startswith("send"):
+            return self._ok(self._message(chat_id))
+        return self._ok(True)
+
+    def _start_update(self, user_id: int) -> dict:
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+        return {
+            "update_id": next(self._update_ids),
+            "message": {"message_id": next(self._message_ids), "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}, "from": user, "text": "/start",
+                        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]},
+        }
+
+    async def handle_generate_updates(self, request: web.Request) -> web.Response:
+        if not self.webhook.get("url"):
+            return web.json_response({"error": "no webhook set"}, status=409)
+        count = int(request.query.get("count", 100))
+        concurrency = int(request.query.get("concurrency", 10))
+        first_user = int(request.query.get("first_user", 1_000_000))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook.get("secret_token") or ""}
+
+        statuses: Counter[int] = Counter()
+        latencies: list[float] = []
+        users = iter(range(first_user, first_user + count))
+
+        async def poster(session: aiohttp.ClientSession) -> None:
+            for user_id in users:
+                started = time.monotonic()
+                async with session.post(self.webhook["url"], json=self._start_update(user_id),
+                                        headers=headers) as response:
+                    statuses[response.status] += 1
+                latencies.append(time.monotonic() - started)
+
+        started = time.monotonic()
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(poster(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        latencies.sort()
+        return web.json_response({
+            "count": count,
+            "elapsed_sec": round(elapsed, 3),
+            "updates_per_sec": round(count / elapsed, 1) if elapsed else None,
+            "statuses": statuses,
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "errors": self.errors, "webhook": self.webhook})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate", type=float, default=0, help="Sending calls per second before 429, 0 - no limit")
+    parser.add_argument("--blocked-every", type=int, default=0, help="Chats with id divisible by it answer 403")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency_ms / 1000, rate=args.rate, blocked_every=args.blocked_every)
+    web.run_app(api.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
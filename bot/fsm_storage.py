@@ -0,0 +1,58 @@
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.models import bot_fsm_states
+
+
+class PostgresStorage(BaseStorage):
+    """
+    aiogram FSM storage in `bot_fsm_states`, so a conversation can go on on any bot replica.
+    Data has to be JSON serializable. `update_data` merges in a single statement, so concurrent updates of
+    different fields of one key (e.g. on two replicas) don't overwrite each other.
+    """
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _upsert(self, key: StorageKey, **values) -> None:
+        stmt = insert(bot_fsm_states).values(key=self.key_builder.build(key), **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[bot_fsm_states.c.key],
+                                          set_={**values, "updated_at": func.now()})
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt)
+
+    async def _get(self, key: StorageKey, column) -> Any:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(column).where(bot_fsm_states.c.key == self.key_builder.build(key)))
+            return result.scalar_one_or_none()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(key, bot_fsm_states.c.state)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._upsert(key, data=data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self._get(key, bot_fsm_states.c.data) or {})
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        stmt = insert(bot_fsm_states).values(key=self.key_builder.build(key), data=data)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[bot_fsm_states.c.key],
+            set_={"data": bot_fsm_states.c.data.op("||", return_type=JSONB)(stmt.excluded.data),
+                  "updated_at": func.now()},
+        ).returning(bot_fsm_states.c.data)
+        async with self.engine.begin() as conn:
+            result = await conn.execute(stmt)
+            return dict(result.scalar_one())
+
+    async def close(self) -> None:
+        pass  # The engine belongs to the bot's pool
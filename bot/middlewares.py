@@ -0,0 +1,87 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.bot_logger import logger
+from bot.cache import bot_cache
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    One database session per update, handlers get it as the `session` argument.
+    A connection is taken from the pool on the first statement only, so updates that don't need the database
+    don't hold one.
+    """
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        self.session_factory = session_factory
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_factory() as session:
+            data["session"] = session
+            return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-chat token bucket, `rate` updates per second (0 - no limit) with bursts up to `burst`; updates over the limit
+    are dropped before any handler (or the FSM and session middlewares) runs. Superusers known to the cache aren't
+    limited, a broadcast is composed of many messages in a row.
+    Buckets are (tokens, updated_at) pairs, every `sweep_interval` the full ones (idle chats) are removed.
+    """
+    def __init__(self, rate: float, burst: float, sweep_interval: float):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_interval = sweep_interval
+        self._buckets: dict[int, tuple[float, float]] = {}
+        self._next_sweep_at = time.monotonic() + sweep_interval
+        self._throttled_since_sweep = 0
+        self.stats = {"passed": 0, "throttled": 0, "swept": 0}
+
+    def metrics(self) -> dict:
+        return {**self.stats, "tracked_chats": len(self._buckets)}
+
+    def _sweep(self, now: float) -> None:
+        refill_time = self.burst / self.rate
+        idle = [chat_id for chat_id, (_, updated_at) in self._buckets.items() if now - updated_at >= refill_time]
+        for chat_id in idle:
+            del self._buckets[chat_id]
+        self.stats["swept"] += len(idle)
+        if self._throttled_since_sweep:
+            logger.info("Throttled %s updates, %s chats tracked", self._throttled_since_sweep, len(self._buckets))
+        self._throttled_since_sweep = 0
+        self._next_sweep_at = now + self.sweep_interval
+
+    def allow(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        if now >= self._next_sweep_at:
+            self._sweep(now)
+        tokens, updated_at = self._buckets.get(chat_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets[chat_id] = (tokens, now)
+            return False
+        self._buckets[chat_id] = (tokens - 1, now)
+        return True
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        # Set by aiogram's user context middleware, which runs first
+        chat = data.get("event_chat") or data.get("event_from_user")
+        if chat is None or self.rate <= 0 or bot_cache.superusers.is_cached(str(chat.id)) or self.allow(chat.id):
+            self.stats["passed"] += 1
+            return await handler(event, data)
+        self.stats["throttled"] += 1
+        self._throttled_since_sweep += 1
+        return None
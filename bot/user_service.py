@@ -1,86 +1,53 @@
-from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.cache import bot_cache
 from core import logger
-from core.models import TgUser, db_helper
+from core.models import TgUser
+from core.services import upsert_tg_user
 
 
 class UserService:
+    """
+    User operations of the bot handlers, on the session of the update (`DbSessionMiddleware`).
+    """
 
     @staticmethod
-    async def create_user(tg_user: str, username: str | None) -> TgUser:
-        async for session in db_helper.session_getter():
-            try:
-                # Check if user exists
-                result = await session.execute(select(TgUser).where(TgUser.tg_user == tg_user))
-                existing_user = result.scalar_one_or_none()
-
-                if existing_user:
-                    logger.info("User %s already exists", tg_user)
-                    return existing_user
-
-                user = TgUser(tg_user=tg_user, username=username, is_superuser=False)
-                session.add(user)
-                await session.commit()
-                await session.refresh(user)
-                return user
-
-            except Exception as e:
-                logger.exception(f"Error in create_user: {e}")
-                await session.rollback()
-            finally:
-                await session.close()
+    async def touch_user(session: AsyncSession, tg_user: str, username: str | None) -> tuple[TgUser, bool] | None:
+        """
+        Create the user or update its username and return it, one statement (INSERT ... ON CONFLICT ... RETURNING).
+        A user unreachable by broadcasts is active again.
+
+        :return: User and True if it was created, None on error
+        """
+        try:
+            user, created = await upsert_tg_user(session, tg_user, username, overwrite_username=True,
+                                                 reactivate=True)
+            await session.commit()
+            return user, created
+        except Exception as e:
+            logger.exception(f"Error in touch_user: {e}")
+            await session.rollback()
 
     @staticmethod
-    async def get_user(tg_user: str) -> TgUser | None:
-        async for session in db_helper.session_getter():
-            try:
-                result = await session.execute(select(TgUser).where(TgUser.tg_user == tg_user))
-                return result.scalar_one_or_none()
-            except Exception as e:
-                logger.exception(f"Error in get_user: {e}")
-            finally:
-                await session.close()
-
-    @staticmethod
-    async def get_all_users() -> list[TgUser]:
-        async for session in db_helper.session_getter():
-            try:
-                result = await session.execute(select(TgUser))
-                return result.scalars().unique().all()
-            except Exception as e:
-                logger.exception(f"Error in get_all_users: {e}")
-            finally:
-                await session.close()
-
-    @classmethod
-    async def is_superuser(cls, chat_id: str) -> bool:
-        async for session in db_helper.session_getter():
-            try:
-                result = await session.execute(select(TgUser).where(TgUser.tg_user == chat_id))
-                user = result.scalar_one_or_none()
-                return user is not None and user.is_superuser
-            except Exception as e:
-                logger.exception(f"Error in is_superuser: {e}")
-            finally:
-                await session.close()
+    async def reactivate_user(session: AsyncSession, tg_user: str) -> None:
+        """
+        Mark a user known to be registered active again. Matches no row (and writes nothing) if it already is,
+        the user may have been marked unreachable by another bot process.
+        """
+        try:
+            await session.execute(
+                update(TgUser).where(TgUser.tg_user == tg_user, TgUser.status != "active").values(status="active")
+            )
+            await session.commit()
+        except Exception as e:
+            logger.exception(f"Error in reactivate_user: {e}")
+            await session.rollback()
 
     @staticmethod
-    async def update_username(tg_user: str, new_username: str | None) -> bool:
-        async for session in db_helper.session_getter():
-            try:
-                user = await session.execute(select(TgUser).where(TgUser.tg_user == tg_user))
-                user = user.scalar_one_or_none()
-                if user:
-                    user.username = new_username
-                    await session.commit()
-                    logger.info(f"Updated username for user {tg_user} to {new_username}")
-                    return True
-                else:
-                    logger.warning(f"User {tg_user} not found for username update")
-                    return False
-            except Exception as e:
-                logger.exception(f"Error in update_username: {e}")
-                await session.rollback()
-                return False
-            finally:
-                await session.close()
+    async def is_superuser(session: AsyncSession, chat_id: str) -> bool:
+        try:
+            return await bot_cache.superusers.contains(session, chat_id)
+        except Exception as e:
+            logger.exception(f"Error in is_superuser: {e}")
+            return False
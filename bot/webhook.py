@@ -0,0 +1,112 @@
+"""
+Webhook mode: Telegram posts updates to an aiohttp app, so any number of bot replicas can run behind a load balancer.
+Updates are answered 200 right away and processed by a fixed pool of workers from a bounded queue; when the queue
+is full the request gets 503 and Telegram delivers the update again later.
+"""
+
+import asyncio
+import secrets
+from typing import Callable
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from bot.bot_logger import logger
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    :param secret_token: Checked against the `X-Telegram-Bot-Api-Secret-Token` header, given to `setWebhook`
+    :param queue_size: Max updates accepted and not processed yet
+    :param workers: Updates processed concurrently
+    :param shutdown_timeout: Seconds to finish the accepted updates on shutdown
+    :param metrics: More metrics for the health check, name -> function returning a dict
+    """
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str, secret_token: str, queue_size: int, workers: int,
+                 shutdown_timeout: float = 30, metrics: dict[str, Callable[[], dict]] | None = None):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.metrics = metrics or {}
+        self._queue: asyncio.Queue[types.Update] = asyncio.Queue(maxsize=queue_size)
+        self._worker_tasks: list[asyncio.Task] = []
+        self._accepting = False
+        self.stats = {"accepted": 0, "rejected": 0, "processed": 0, "failed": 0}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            logger.warning("Invalid webhook update: %s", e)
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return web.Response(status=503)
+        self.stats["accepted"] += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        status = 200 if self._accepting else 503
+        metrics = {name: get_metrics() for name, get_metrics in self.metrics.items()}
+        return web.json_response({**self.stats, "queued": self._queue.qsize(), **metrics}, status=status)
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.exception(f"Error processing update {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._accepting = True
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        # New updates get 503 (Telegram retries them on another replica), the accepted ones are finished
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook shutdown: %s updates left unprocessed", self._queue.qsize())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+
+async def run_webhook(server: WebhookServer, host: str, port: int, stop: asyncio.Event) -> None:
+    """
+    Serve until `stop` is set, then shut down gracefully.
+    """
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s%s", host, port, server.path)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
@@ -1,68 +1,109 @@
 import asyncio
+import signal
 
-from aiogram.enums import ContentType
 from aiogram.filters import CommandStart, Command
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.models import db_helper, WelcomeMessage
+from core.models import db_pools, ensure_schemas, broadcasts_schema, bot_fsm_schema
 
 from core import settings
 from bot.bot_logger import logger
 from bot.user_service import UserService
+from bot.cache import bot_cache
+from bot.middlewares import DbSessionMiddleware, ThrottlingMiddleware
+from bot.broadcast import BroadcastEngine
+from bot.broadcast_jobs import BroadcastJobRunner
+from bot.broadcast_payload import message_ref, plan_steps, send_step
+from bot.fsm_storage import PostgresStorage
+from bot.webhook import WebhookServer, run_webhook
 
 
 BOT_TOKEN = settings.bot.token
+WEBHOOK_MODE = settings.bot.mode == "webhook"
 
-dp = Dispatcher()
+db_helper = db_pools.get("bot")
+
+# Replicas behind a load balancer share the conversations state through the database. Updates of one chat are
+# handled one at a time within a process, across replicas only `update_data` merges are safe
+dp = Dispatcher(storage=PostgresStorage(db_helper.engine) if WEBHOOK_MODE else MemoryStorage(),
+                events_isolation=SimpleEventIsolation())
 
 confirming_words = ["да", "yes", "конечно", "отправить", "send", "accept", "absolutely"]
 error_message = ("Извините, произошла ошибка. Пожалуйста, попробуйте позже или обратитесь к разработчику с подробной "
                  "информацией: когда и после какого действия произошла ошибка.")
 user_error_message = settings.bot.user_error_message
 
-user_service = UserService()
+# Floods from one chat are dropped before anything else, then handlers get one session per update as `session`
+throttling = ThrottlingMiddleware(
+    rate=settings.bot.throttle_rate,
+    burst=settings.bot.throttle_burst,
+    sweep_interval=settings.bot.throttle_sweep_sec,
+)
+# aiogram registers its FSM middleware (a database read in webhook mode) in the constructor, it goes back after
+# the throttling so dropped updates cost nothing
+dp.update.outer_middleware.unregister(dp.fsm)
+dp.update.outer_middleware(throttling)
+dp.update.outer_middleware(dp.fsm)
+dp.update.middleware(DbSessionMiddleware(db_helper.session_factory))
+
+broadcast_engine = BroadcastEngine(
+    target_rate=settings.bot.broadcast_rate,
+    concurrency=settings.bot.broadcast_concurrency,
+    chat_interval=settings.bot.broadcast_chat_interval_ms / 1000,
+)
 
 
 @dp.message(CommandStart())
-async def start_handler(message: types.Message):
+async def start_handler(message: types.Message, session: AsyncSession):
     username = message.from_user.username
     chat_id = str(message.chat.id)
 
-    async for session in db_helper.session_getter():
-        try:
-            # Get welcome message
-            welcome_message = await WelcomeMessage.get_message(session)
-
-            user = await user_service.get_user(chat_id)
-            if not user:
-                user = await user_service.create_user(chat_id, username)
-                logger.info("Created new user: %s, username: %s", user.tg_user, user.username)
+    try:
+        # Get welcome message
+        welcome_message = await bot_cache.welcome_message.get(session)
 
-            elif user.username != username:
-                updated = await user_service.update_username(chat_id, username)
-                if updated:
-                    logger.info("Updated username for user %s to %s", chat_id, username)
-                else:
-                    logger.warning("Failed to update username for user %s", chat_id)
+        # Creates the user or updates the username in one statement, unless it was done recently. Then only
+        # a blocked status is reset, it could be set by a broadcast on another bot process
+        if bot_cache.users.is_known(chat_id, username):
+            await UserService.reactivate_user(session, chat_id)
+        else:
+            touched = await UserService.touch_user(session, chat_id, username)
+            if touched is None:
+                logger.warning("Failed to register user %s", chat_id)
+            else:
+                bot_cache.users.add(chat_id, username)
+                if touched[1]:
+                    logger.info("Created new user: %s, username: %s", chat_id, username)
 
-                logger.info("Updated username for user %s to %s", user.tg_user, user.username)
+        if welcome_message and '{username}' in welcome_message:
+            formatted_message = welcome_message.format(username=username or "пользователь")
+        else:
+            formatted_message = welcome_message
 
-            if welcome_message and '{username}' in welcome_message:
-                formatted_message = welcome_message.format(username=username or "пользователь")
-            else:
-                formatted_message = welcome_message
+        await message.answer(formatted_message)
 
-            await message.answer(formatted_message)
+    except Exception as e:
+        logger.error(f"Database error in start_handler: {e}")
 
-        except Exception as e:
-            logger.error(f"Database error in start_handler: {e}")
+        await message.answer(user_error_message)
 
-            await message.answer(user_error_message)
 
-        finally:
-            await session.close()
+broadcast_job_runner = BroadcastJobRunner(
+    engine=db_helper.engine,
+    broadcast_engine=broadcast_engine,
+    send=send_step,
+    batch_size=settings.bot.broadcast_batch_size,
+    checkpoint_interval=settings.bot.broadcast_checkpoint_sec,
+    global_rate=settings.bot.broadcast_rate,
+    lease_time=settings.bot.broadcast_lease_sec,
+    poll_interval=settings.bot.broadcast_poll_sec,
+)
 
 
 class AdminBroadcastStates(StatesGroup):
@@ -70,15 +111,26 @@ class AdminBroadcastStates(StatesGroup):
     WAITING_FOR_CONFIRMATION = State()
 
 
+MESSAGE_FIELD_PREFIX = "message_"
+
+
+def collected_messages(data: dict) -> list[dict]:
+    """
+    References of the messages added to the broadcast, in the order they were sent.
+    """
+    refs = [ref for field, ref in data.items() if field.startswith(MESSAGE_FIELD_PREFIX)]
+    return sorted(refs, key=lambda ref: ref["message_id"])
+
+
 @dp.message(Command("broadcast"))
-async def start_broadcast(message: types.Message, state: FSMContext):
+async def start_broadcast(message: types.Message, state: FSMContext, session: AsyncSession):
     try:
-        if not await UserService.is_superuser(str(message.from_user.id)):
+        if not await UserService.is_superuser(session, str(message.from_user.id)):
             await message.answer("У вас нет прав для выполнения этой команды.")
             return
 
         await state.set_state(AdminBroadcastStates.WAITING_FOR_MESSAGE)
-        await state.update_data(messages=[])
+        await state.set_data({})
 
         await message.answer(
             "Введите сообщение для массовой рассылки. Вы можете отправить следующие типы контента:\n\n"
@@ -106,8 +158,7 @@ async def start_broadcast(message: types.Message, state: FSMContext):
 @dp.message(Command("done"))
 async def process_done_command(message: types.Message, state: FSMContext):
     try:
-        data = await state.get_data()
-        messages = data.get('messages', [])
+        messages = collected_messages(await state.get_data())
 
         if not messages:
             await message.answer("Вы не добавили ни одного сообщения для рассылки. Пожалуйста, добавьте хотя бы одно сообщение.")
@@ -115,36 +166,8 @@ async def process_done_command(message: types.Message, state: FSMContext):
 
         await message.answer("Вот предварительный просмотр вашей рассылки:")
 
-        for msg_data in messages:
-            msg = msg_data['message']
-            entities = msg_data['entities']
-
-            if msg.content_type == ContentType.TEXT:
-                await message.answer(msg.text, entities=entities)
-            elif msg.content_type == ContentType.PHOTO:
-                await message.answer_photo(msg.photo[-1].file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.VIDEO:
-                await message.answer_video(msg.video.file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.AUDIO:
-                await message.answer_audio(msg.audio.file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.DOCUMENT:
-                await message.answer_document(msg.document.file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.ANIMATION:
-                await message.answer_animation(msg.animation.file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.VOICE:
-                await message.answer_voice(msg.voice.file_id, caption=msg.caption, caption_entities=entities)
-            elif msg.content_type == ContentType.VIDEO_NOTE:
-                await message.answer_video_note(msg.video_note.file_id)
-            elif msg.content_type == ContentType.STICKER:
-                await message.answer_sticker(msg.sticker.file_id)
-            elif msg.content_type == ContentType.LOCATION:
-                await message.answer_location(msg.location.latitude, msg.location.longitude)
-            elif msg.content_type == ContentType.VENUE:
-                await message.answer_venue(msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-            elif msg.content_type == ContentType.CONTACT:
-                await message.answer_contact(msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-            else:
-                await message.answer(f"Неподдерживаемый тип сообщения: {msg.content_type}")
+        for step in plan_steps(messages):
+            await send_step(message.bot, message.chat.id, step)
 
         await state.set_state(AdminBroadcastStates.WAITING_FOR_CONFIRMATION)
         await message.answer(
@@ -158,15 +181,9 @@ async def process_done_command(message: types.Message, state: FSMContext):
 @dp.message(AdminBroadcastStates.WAITING_FOR_MESSAGE)
 async def process_broadcast_message(message: types.Message, state: FSMContext):
     try:
-        data = await state.get_data()
-        messages = data.get('messages', [])
-
-        messages.append({
-            'message': message,
-            'entities': message.entities or message.caption_entities
-        })
-
-        await state.update_data(messages=messages)
+        # Only a reference, the message is copied from this chat when the broadcast is sent. One field per message:
+        # album parts arrive at once, a merge doesn't lose any of them where a read-append-write would
+        await state.update_data({f"{MESSAGE_FIELD_PREFIX}{message.message_id}": message_ref(message)})
         await message.answer("Сообщение добавлено в рассылку. Отправьте еще сообщения или используйте /done для завершения.")
     except Exception as e:
         logger.error(f"Error in process_broadcast_message: {e}")
@@ -181,63 +198,13 @@ async def confirm_broadcast(message: types.Message, state: FSMContext):
             await state.clear()
             return
 
-        data = await state.get_data()
-        broadcast_messages = data['messages']
-
-        all_users = await user_service.get_all_users()
-        failed_users = []
-        users_counter = 0
-
-        for user in all_users:
-            try:
-                for msg_data in broadcast_messages:
-                    msg = msg_data['message']
-                    entities = msg_data['entities']
-
-                    if msg.content_type == ContentType.TEXT:
-                        await message.bot.send_message(int(user.tg_user), msg.text, entities=entities)
-                    elif msg.content_type == ContentType.PHOTO:
-                        await message.bot.send_photo(int(user.tg_user), msg.photo[-1].file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.VIDEO:
-                        await message.bot.send_video(int(user.tg_user), msg.video.file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.AUDIO:
-                        await message.bot.send_audio(int(user.tg_user), msg.audio.file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.DOCUMENT:
-                        await message.bot.send_document(int(user.tg_user), msg.document.file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.ANIMATION:
-                        await message.bot.send_animation(int(user.tg_user), msg.animation.file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.VOICE:
-                        await message.bot.send_voice(int(user.tg_user), msg.voice.file_id, caption=msg.caption, caption_entities=entities)
-                    elif msg.content_type == ContentType.VIDEO_NOTE:
-                        await message.bot.send_video_note(int(user.tg_user), msg.video_note.file_id)
-                    elif msg.content_type == ContentType.STICKER:
-                        await message.bot.send_sticker(int(user.tg_user), msg.sticker.file_id)
-                    elif msg.content_type == ContentType.LOCATION:
-                        await message.bot.send_location(int(user.tg_user), msg.location.latitude, msg.location.longitude)
-                    elif msg.content_type == ContentType.VENUE:
-                        await message.bot.send_venue(int(user.tg_user), msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-                    elif msg.content_type == ContentType.CONTACT:
-                        await message.bot.send_contact(int(user.tg_user), msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-                    else:
-                        await message.bot.send_message(int(user.tg_user), f"Извините, не поддерживаемый тип контента: {msg.content_type}.")
-
-                    users_counter += 1
-
-                    # Sleep to avoid API-flooding/spam block from Telegram
-                    await asyncio.sleep(0.05)
-
-            except Exception as e:
-                logger.info(f"Failed to send broadcast to user {user.tg_user}: {str(e)}")
-                failed_users.append(user.tg_user)
-                continue
-
-        if failed_users:
-            await message.answer(
-                f"Рассылка выполнена, успешно отправлено {users_counter} пользователям, "
-                f"но не удалось отправить сообщение {len(failed_users)} пользователям. "
-                f"Пользователи могли не активировать чат с ботом.")
-        else:
-            await message.answer(f"Рассылка выполнена успешно: отправлено всем {users_counter} пользователям.")
+        broadcast_messages = collected_messages(await state.get_data())
+
+        # Job runs in the background and survives restarts, progress is shown by editing this message
+        status_message = await message.answer("Рассылка запускается...")
+        job_id = await broadcast_job_runner.create_job(str(message.from_user.id), broadcast_messages, status_message)
+        broadcast_job_runner.start(message.bot, job_id)
+        logger.warning("Broadcast job %s created by %s", job_id, message.from_user.id)
 
         await state.clear()
     except Exception as e:
@@ -245,19 +212,69 @@ async def confirm_broadcast(message: types.Message, state: FSMContext):
         await message.answer(error_message)
 
 
+def create_bot() -> Bot:
+    if settings.bot.api_url:
+        # Own Bot API server, e.g. the local fake one for tests (`python -m bot.fake_bot_api`)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot.api_url))
+        return Bot(token=BOT_TOKEN, session=session)
+    return Bot(token=BOT_TOKEN)
+
+
+async def start_webhook(bot: Bot) -> None:
+    if not settings.bot.webhook_url or not settings.bot.webhook_secret:
+        raise ValueError("TGBOT_WEBHOOK_URL and TGBOT_WEBHOOK_SECRET are required in webhook mode")
+
+    # Every replica sets the same webhook, the load balancer spreads the updates
+    await bot.set_webhook(
+        settings.bot.webhook_url.rstrip("/") + settings.bot.webhook_path,
+        secret_token=settings.bot.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    server = WebhookServer(
+        dp, bot,
+        path=settings.bot.webhook_path,
+        secret_token=settings.bot.webhook_secret,
+        queue_size=settings.bot.webhook_queue_size,
+        workers=settings.bot.webhook_workers,
+        metrics={"throttling": throttling.metrics},
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot)
+    try:
+        await run_webhook(server, settings.bot.webhook_host, settings.bot.webhook_port, stop)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+
+
 async def main():
-    bot = Bot(token=BOT_TOKEN)
+    bot = create_bot()
 
     try:
-        logger.info("Starting bot polling...")
-        await dp.start_polling(bot)
+        # Bot tables, then take part in the running broadcast jobs together with the other bot workers
+        await ensure_schemas(db_helper.engine, broadcasts_schema, bot_fsm_schema)
+        asyncio.create_task(broadcast_job_runner.run(bot))
+
+        if WEBHOOK_MODE:
+            logger.info("Starting bot webhook server...")
+            await start_webhook(bot)
+        else:
+            logger.info("Starting bot polling...")
+            # Updates can't be polled while a webhook is set (the bot ran in webhook mode before)
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
 
     except Exception as e:
         logger.exception(f"Error starting bot: {e}")
 
     finally:
         logger.info("Disposing bot...")
+        await broadcast_job_runner.stop()
         await bot.session.close()
+        await db_pools.dispose()
 
 
 if __name__ == "__main__":
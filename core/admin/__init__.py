@@ -1,4 +1,4 @@
-__all__ = ["async_sqladmin_db_helper", "sqladmin_authentication_backend"]
+__all__ = ["async_sqladmin_db_helper", "sqladmin_authentication_backend", "is_admin_request"]
 
 from .sqladmin_db_helper import async_sqladmin_db_helper
-from .sqladmin_auth import sqladmin_authentication_backend
+from .sqladmin_auth import sqladmin_authentication_backend, is_admin_request
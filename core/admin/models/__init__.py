@@ -1,6 +1,7 @@
 __all__ = ["DocumentAdmin", "TransferRuleAdmin", "TransferProviderAdmin",
            "CurrencyAdmin", "CountryAdmin", "ProviderExchangeRateAdmin",
-           "TgUserAdmin", "TgUserLogAdmin", "WelcomeMessageAdmin"]
+           "TgUserAdmin", "TgUserLogAdmin", "WelcomeMessageAdmin",
+           "SlowQueryAdmin", "ConnectionPoolAdmin"]
 
 from .exchange_rate import ProviderExchangeRateAdmin
 from .transfer_rule import TransferRuleAdmin
@@ -10,3 +11,5 @@ from .currency import CurrencyAdmin
 from .country import CountryAdmin
 from .tg_user import TgUserAdmin, TgUserLogAdmin
 from .tg_welcome_message import WelcomeMessageAdmin
+from .slow_query import SlowQueryAdmin
+from .connection_pool import ConnectionPoolAdmin
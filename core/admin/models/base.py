@@ -35,7 +35,7 @@ class BaseAdminModel(ModelView):
                         if model:
                             model.is_active = is_active
                     await session.commit()
-                logger.info(f"Successfully {'activated' if is_active else 'deactivated'} {len(pks)} objects")
+                logger.info("Successfully %s %s objects", 'activated' if is_active else 'deactivated', len(pks))
             except Exception as e:
                 logger.error(f"An error occurred: {str(e)}")
                 await session.rollback()
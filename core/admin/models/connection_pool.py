@@ -0,0 +1,22 @@
+from sqladmin import BaseView, expose
+from starlette.requests import Request
+
+from core.models import db_pools
+
+
+class ConnectionPoolAdmin(BaseView):
+    name = "Connection Pools"
+    icon = "fa-solid fa-database"
+    category = "Monitoring"
+
+    @expose("/connection-pools", methods=["GET"])
+    async def connection_pools_page(self, request: Request):
+        return await self.templates.TemplateResponse(
+            request,
+            "connection_pools.html",
+            context={
+                "pools": db_pools.stats(),
+                "pool_pre_ping": db_pools.pool_pre_ping,
+                "pool_recycle": db_pools.pool_recycle,
+            },
+        )
@@ -54,7 +54,7 @@ class CountryAdmin(BaseAdminModel, model=Country):
     async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
         try:
             action = "Created" if is_created else "Updated"
-            logger.info(f"{action} country: {model.name}, abbreviation: {model.abbreviation}")
+            logger.info("%s country: %s, abbreviation: %s", action, model.name, model.abbreviation)
         except Exception as e:
             logger.error(f"Error in after_model_change for country: {str(e)}")
             raise HTTPException(status_code=500, detail="An unexpected error occurred while processing your request.")
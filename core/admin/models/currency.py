@@ -84,7 +84,7 @@ class CurrencyAdmin(BaseAdminModel, model=Currency):
     async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request):
         try:
             action = "Created" if is_created else "Updated"
-            logger.info(f"{action} currency: {model.name} ({model.abbreviation})")
+            logger.info("%s currency: %s (%s)", action, model.name, model.abbreviation)
         except Exception as e:
             logger.exception(f"Unexpected error occurred in after_model_change: {e}")
             raise HTTPException(status_code=500, detail="An unexpected error occurred while processing your request.")
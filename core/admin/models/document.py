@@ -37,6 +37,6 @@ class DocumentAdmin(BaseAdminModel, model=Document):
     async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
         try:
             action = "Created" if is_created else "Updated"
-            logger.info(f"{action} document: {model.name}")
+            logger.info("%s document: %s", action, model.name)
         except Exception as e:
             logger.error(f"Error in after_model_change for document: {e}")
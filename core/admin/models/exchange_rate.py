@@ -85,6 +85,6 @@ class ProviderExchangeRateAdmin(BaseAdminModel, model=ProviderExchangeRate):
     async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
         try:
             action = "Created" if is_created else "Updated"
-            logger.info(f"{action} exchange rate successfully")
+            logger.info("%s exchange rate successfully", action)
         except Exception as e:
             logger.error(f"Error in after_model_change for exchange rate: {e}")
@@ -0,0 +1,99 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, ClassVar
+
+from sqladmin import ModelView
+from sqladmin.pagination import Pagination
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, selectinload
+from starlette.datastructures import URL
+from starlette.requests import Request
+
+from core import settings
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    """
+    Pagination whose link to the next page carries the last key of this page as `after`.
+    """
+    next_after: str | None = None
+
+    def _add_page_control(self, base_url: URL, page: int) -> None:
+        base_url = base_url.remove_query_params("after")
+        if page == self.page + 1 and self.next_after is not None:
+            base_url = base_url.include_query_params(after=self.next_after)
+        super()._add_page_control(base_url, page)
+
+
+class ScalableModelView(ModelView):
+    """
+    List view for huge tables:
+    - count is the planner estimate (EXPLAIN) when it's above `estimated_count_threshold`, exact COUNT(*) below it;
+    - with the default sort, pages are read by keyset on `keyset_columns` (descending): the "next" link carries
+      the last key of the page (`after=<values>`), so the next page is `WHERE (keys) < after LIMIT n` instead of
+      OFFSET, for exactly the list in the URL (search, filters, page size). Jumps to other pages, custom sorts
+      and invalid cursors fall back to OFFSET.
+    """
+    keyset_columns: ClassVar[tuple[InstrumentedAttribute, ...]] = ()
+
+    async def _estimated_count(self, stmt: Select) -> int:
+        async with self.session_maker() as session:
+            conn = await session.connection()
+            compiled = stmt.compile(dialect=conn.dialect)
+            params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+            plan = result.scalar_one()
+            estimate = int((json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]["Plan Rows"])
+            if estimate >= settings.admin_panel.estimated_count_threshold:
+                return estimate
+            result = await session.execute(select(func.count()).select_from(stmt.order_by(None).subquery()))
+            return result.scalar_one()
+
+    def _encode_key(self, row: Any) -> str:
+        values = (getattr(row, column.key) for column in self.keyset_columns)
+        return ",".join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values)
+
+    def _decode_key(self, after: str | None) -> tuple | None:
+        if not after:
+            return None
+        values = after.split(",")
+        if len(values) != len(self.keyset_columns):
+            return None
+        try:
+            return tuple(datetime.fromisoformat(value) if column.type.python_type is datetime
+                         else column.type.python_type(value)
+                         for column, value in zip(self.keyset_columns, values))
+        except (ValueError, NotImplementedError):
+            return None
+
+    async def list(self, request: Request) -> KeysetPagination:
+        page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = self.validate_page_number(request.query_params.get("pageSize"), 0)
+        page_size = min(page_size or self.page_size, max(self.page_size_options))
+        search = request.query_params.get("search", None)
+
+        stmt = self.list_query(request)
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+        count = await self._estimated_count(stmt)
+
+        for relation in self._list_relations:
+            stmt = stmt.options(selectinload(relation))
+
+        keyset = bool(self.keyset_columns) and not request.query_params.get("sortBy")
+        if keyset:
+            stmt = stmt.order_by(*(column.desc() for column in self.keyset_columns))
+            after = self._decode_key(request.query_params.get("after")) if page > 1 else None
+            if after is not None:
+                stmt = stmt.where(tuple_(*self.keyset_columns) < after).limit(page_size)
+            else:
+                stmt = stmt.limit(page_size).offset((page - 1) * page_size)
+        else:
+            stmt = self.sort_query(stmt, request).limit(page_size).offset((page - 1) * page_size)
+
+        rows = await self._run_query(stmt)
+        next_after = self._encode_key(rows[-1]) if keyset and len(rows) == page_size else None
+
+        return KeysetPagination(rows=rows, page=page, page_size=page_size, count=count, next_after=next_after)
@@ -0,0 +1,28 @@
+from sqladmin import BaseView, expose
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+
+from core.slow_query_log import slow_query_log
+
+
+class SlowQueryAdmin(BaseView):
+    name = "Slow Queries"
+    icon = "fa-solid fa-stopwatch"
+    category = "Monitoring"
+
+    @expose("/slow-queries", methods=["GET"])
+    async def slow_queries_page(self, request: Request):
+        return await self.templates.TemplateResponse(
+            request,
+            "slow_queries.html",
+            context={
+                "records": slow_query_log.list(),
+                "threshold_ms": slow_query_log.threshold_ms,
+                "explain_sample_rate": slow_query_log.explain_sample_rate,
+            },
+        )
+
+    @expose("/slow-queries/clear", methods=["POST"])
+    async def clear_slow_queries(self, request: Request):
+        slow_query_log.clear()
+        return RedirectResponse(request.url_for("admin:slow_queries_page"), status_code=302)
@@ -1,13 +1,23 @@
-from sqladmin import ModelView
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Select, select
+from starlette.requests import Request
+
+from core import settings
 from core.models import TgUser, TgUserLog
+from .scalable import ScalableModelView
 
 
-class TgUserAdmin(ModelView, model=TgUser):
-    column_list = [TgUser.id, TgUser.tg_user, TgUser.username, TgUser.created_at, TgUser.is_superuser]
+class TgUserAdmin(ScalableModelView, model=TgUser):
+    column_list = [TgUser.id, TgUser.tg_user, TgUser.username, TgUser.created_at, TgUser.is_superuser, TgUser.status]
     column_searchable_list = [TgUser.id, TgUser.tg_user, TgUser.username]
     column_sortable_list = [TgUser.id, TgUser.created_at, TgUser.is_superuser, TgUser.tg_user, TgUser.username]
-    column_filters = [TgUser.tg_user, TgUser.username, TgUser.is_superuser]
-    column_details_list = [TgUser.id, TgUser.tg_user, TgUser.username, TgUser.created_at, TgUser.is_superuser, TgUser.logs]
+    column_filters = [TgUser.tg_user, TgUser.username, TgUser.is_superuser, TgUser.status]
+    # Logs aren't loaded with the user, the details page reads them page by page
+    column_details_list = [TgUser.id, TgUser.tg_user, TgUser.username, TgUser.created_at, TgUser.is_superuser,
+                           TgUser.status, TgUser.last_failure_at, TgUser.last_failure_reason]
+    details_template = "tg_user_details.html"
+    keyset_columns = (TgUser.id,)
     can_create = False
     can_edit = True
     can_delete = True
@@ -16,19 +26,31 @@ class TgUserAdmin(ModelView, model=TgUser):
     category = "Telegram"
 
 
-class TgUserLogAdmin(ModelView, model=TgUserLog):
-    column_list = [TgUserLog.id, TgUserLog.tg_user, TgUserLog.url_log, TgUserLog.amount_log, TgUserLog.currency_log,
-                   TgUserLog.send_country_log, TgUserLog.receive_country_log, TgUserLog.created_at]
-    column_searchable_list = [TgUserLog.tg_user, TgUserLog.url_log, TgUserLog.currency_log,
-                              TgUserLog.send_country_log, TgUserLog.receive_country_log, ]
-    column_sortable_list = [TgUserLog.id, TgUserLog.tg_user, TgUserLog.url_log, TgUserLog.amount_log,
-                            TgUserLog.send_country_log, TgUserLog.receive_country_log, TgUserLog.created_at,
-                            TgUserLog.currency_log]
-    column_filters = [TgUserLog.tg_user, TgUserLog.currency_log, TgUserLog.url_log, TgUserLog.amount_log,
-                      TgUserLog.send_country_log, TgUserLog.receive_country_log, TgUserLog.created_at]
+class TgUserLogAdmin(ScalableModelView, model=TgUserLog):
+    column_list = [TgUserLog.id, TgUserLog.user, TgUserLog.url_log, TgUserLog.amount, TgUserLog.currency_id,
+                   TgUserLog.send_country_id, TgUserLog.receive_country_id, TgUserLog.created_at]
+    column_details_list = [TgUserLog.id, TgUserLog.user, TgUserLog.url_log,
+                           TgUserLog.amount, TgUserLog.currency_id, TgUserLog.send_country_id,
+                           TgUserLog.receive_country_id, TgUserLog.tg_user, TgUserLog.amount_log,
+                           TgUserLog.currency_log, TgUserLog.send_country_log, TgUserLog.receive_country_log,
+                           TgUserLog.created_at]
+    column_searchable_list = [TgUserLog.url_log]
+    column_sortable_list = [TgUserLog.id, TgUserLog.user_id, TgUserLog.amount, TgUserLog.created_at]
+    column_filters = [TgUserLog.user_id, TgUserLog.currency_id, TgUserLog.send_country_id,
+                      TgUserLog.receive_country_id, TgUserLog.created_at]
+    column_default_sort = [(TgUserLog.created_at, True), (TgUserLog.id, True)]
+    keyset_columns = (TgUserLog.created_at, TgUserLog.id)
     can_create = False
     can_edit = False
     can_delete = True
     name = "Telegram User Log"
     name_plural = "Telegram User Logs"
     category = "Telegram"
+
+    def list_query(self, request: Request) -> Select:
+        stmt = select(TgUserLog)
+        # Only recent logs, so the queries touch just the latest partitions
+        if settings.tg_log.admin_recent_days > 0:
+            since = datetime.now(timezone.utc) - timedelta(days=settings.tg_log.admin_recent_days)
+            stmt = stmt.where(TgUserLog.created_at >= since)
+        return stmt
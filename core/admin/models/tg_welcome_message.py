@@ -5,7 +5,8 @@ from sqlalchemy.exc import IntegrityError
 from starlette.requests import Request
 
 from core import logger
-from core.models import WelcomeMessage, db_helper
+from core.models import WelcomeMessage
+from core.admin import async_sqladmin_db_helper
 
 
 class WelcomeMessageAdmin(ModelView, model=WelcomeMessage):
@@ -18,7 +19,7 @@ class WelcomeMessageAdmin(ModelView, model=WelcomeMessage):
     name_plural = "Welcome Message"
 
     async def on_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
-        async for session in db_helper.session_getter():
+        async for session in async_sqladmin_db_helper.session_getter():
             try:
                 if is_created:
                     # Check if any welcome message exists
@@ -8,7 +8,8 @@ from fastapi import UploadFile
 
 from core import logger
 from core.admin.models.base import BaseAdminModel
-from core.models import TransferProvider, db_helper
+from core.models import TransferProvider
+from core.admin import async_sqladmin_db_helper
 from core import storage
 
 
@@ -39,7 +40,7 @@ class TransferProviderAdmin(BaseAdminModel, model=TransferProvider):
     category = "Providers"
 
     def search_query(self, stmt, term):
-        logger.debug(f"Searching for term: {term}")
+        logger.debug("Searching for term: %s", term)
         return stmt.filter(
             or_(
                 TransferProvider.name.ilike(f"%{term}%"),
@@ -48,7 +49,7 @@ class TransferProviderAdmin(BaseAdminModel, model=TransferProvider):
         )
 
     async def get_object(self, pk: Any) -> TransferProvider | None:
-        async with AsyncSession(db_helper.engine) as session:
+        async with AsyncSession(async_sqladmin_db_helper.engine) as session:
             try:
                 stmt = select(TransferProvider).where(TransferProvider.id == pk)
                 result = await session.execute(stmt)
@@ -60,7 +61,7 @@ class TransferProviderAdmin(BaseAdminModel, model=TransferProvider):
     async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
         try:
             action = "Created" if is_created else "Updated"
-            logger.info(f"{action} transfer provider: {model.name}")
+            logger.info("%s transfer provider: %s", action, model.name)
         except Exception as e:
             logger.error(f"Error in after_model_change for transfer provider: {e}")
 
@@ -71,7 +72,7 @@ class TransferProviderAdmin(BaseAdminModel, model=TransferProvider):
                 contents = await logo.read()
                 file_path = await storage.save(logo.filename, contents)
                 model.logo = file_path
-                logger.info(f"Logo uploaded for provider: {model.name}")
+                logger.info("Logo uploaded for provider: %s", model.name)
             except Exception as e:
                 logger.error(f"Error uploading logo for provider {model.name}: {str(e)}")
 
@@ -80,7 +81,7 @@ class TransferProviderAdmin(BaseAdminModel, model=TransferProvider):
         if model and model.logo:
             try:
                 storage.delete(model.logo)
-                logger.info(f"Logo deleted for provider: {model.name}")
+                logger.info("Logo deleted for provider: %s", model.name)
             except Exception as e:
                 logger.error(f"Error deleting logo for provider {model.name}: {str(e)}")
         return await super().delete_model(request, pk)
@@ -197,7 +197,7 @@ class TransferRuleAdmin(BaseAdminModel, model=TransferRule):
 
                 await session.commit()
                 await session.refresh(model)
-                logger.info(f"TransferRule created successfully with id: {model.id}")
+                logger.info("TransferRule created successfully with id: %s", model.id)
 
                 return model
 
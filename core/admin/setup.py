@@ -0,0 +1,44 @@
+from fastapi import FastAPI
+from sqladmin import Admin
+
+from core import settings
+from core.admin import sqladmin_authentication_backend, async_sqladmin_db_helper
+from core.admin.models import (
+    CountryAdmin,
+    CurrencyAdmin,
+    DocumentAdmin,
+    TransferProviderAdmin,
+    TransferRuleAdmin,
+    ProviderExchangeRateAdmin,
+    TgUserAdmin,
+    TgUserLogAdmin,
+    WelcomeMessageAdmin,
+    SlowQueryAdmin,
+    ConnectionPoolAdmin,
+)
+
+
+def setup_admin(app: FastAPI) -> Admin:
+    """
+    Mount SQLAdmin panel with all the views to the app.
+    Imported only in "full" mode, API-only workers never load sqladmin, WTForms and the admin views.
+
+    :param app: FastAPI application
+    :return: Admin instance
+    """
+    admin = Admin(app, engine=async_sqladmin_db_helper.engine, authentication_backend=sqladmin_authentication_backend,
+                  templates_dir=settings.admin_panel.templates_dir)
+
+    admin.add_view(CurrencyAdmin)
+    admin.add_view(CountryAdmin)
+    admin.add_view(DocumentAdmin)
+    admin.add_view(TransferProviderAdmin)
+    admin.add_view(ProviderExchangeRateAdmin)
+    admin.add_view(TransferRuleAdmin)
+    admin.add_view(TgUserAdmin)
+    admin.add_view(TgUserLogAdmin)
+    admin.add_view(WelcomeMessageAdmin)
+    admin.add_view(SlowQueryAdmin)
+    admin.add_view(ConnectionPoolAdmin)
+
+    return admin
@@ -1,3 +1,7 @@
+import json
+from base64 import b64decode
+
+from itsdangerous import TimestampSigner, BadSignature
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
 
@@ -5,6 +9,11 @@ from starlette.requests import Request
 from core import settings
 
 
+# Same defaults as starlette's SessionMiddleware, which sqladmin installs on the admin sub-app
+SESSION_COOKIE_NAME = "session"
+SESSION_MAX_AGE = 14 * 24 * 60 * 60
+
+
 class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         form = await request.form()
@@ -34,3 +43,29 @@ class AdminAuth(AuthenticationBackend):
 
 # Create the authentication backend instance
 sqladmin_authentication_backend = AdminAuth(secret_key=settings.admin_panel.secret_key)
+
+
+async def is_admin_request(request: Request) -> bool:
+    """
+    Check if the request carries a valid sqladmin session cookie.
+
+    The session middleware lives only on the mounted admin app, so for requests outside of `/admin`
+    the signed cookie is decoded here and handed over to `sqladmin_authentication_backend`.
+
+    :param request: Any incoming request
+    :return: True if the admin session is valid
+    """
+    cookie = request.cookies.get(SESSION_COOKIE_NAME)
+    if not cookie:
+        return False
+
+    signer = TimestampSigner(str(settings.admin_panel.secret_key))
+    try:
+        data = signer.unsign(cookie.encode("utf-8"), max_age=SESSION_MAX_AGE)
+        session = json.loads(b64decode(data))
+    except (BadSignature, ValueError):
+        return False
+
+    scope = dict(request.scope)
+    scope["session"] = session
+    return await sqladmin_authentication_backend.authenticate(Request(scope))
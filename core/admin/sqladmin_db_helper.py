@@ -1,20 +1,5 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from core.models.db_helper import db_pools
 
-from core import settings
 
-
-class AsyncDataBaseHelper:
-    def __init__(self, url: str, echo: bool):
-        self.engine: AsyncEngine = create_async_engine(
-            url=url,
-            echo=echo,
-        )
-
-    async def dispose(self):
-        await self.engine.dispose()
-
-
-async_sqladmin_db_helper = AsyncDataBaseHelper(
-    url=settings.db.url,
-    echo=False,
-)
+# Admin panel works on its own pool (same database, separate limits from the API one)
+async_sqladmin_db_helper = db_pools.get("admin")
@@ -8,6 +8,8 @@ from dotenv import load_dotenv
 import logging
 from pythonjsonlogger import jsonlogger
 
+from utils import make_queue_handler
+
 
 load_dotenv(".env")
 
@@ -15,6 +17,9 @@ load_dotenv(".env")
 APP_RUN_HOST = str(os.getenv("APP_RUN_HOST", "0.0.0.0"))
 APP_RUN_PORT = int(os.getenv("APP_RUN_PORT", 8000))
 DEBUG = os.getenv("DEBUG", "False").lower() in ('true', '1')
+# "full" - API + admin panel, "api" - API only, without admin panel imports (for scaled API replicas)
+APP_MODE = os.getenv("APP_MODE", "full").lower()
+APP_IMPORT_REPORT = os.getenv("APP_IMPORT_REPORT", "False").lower() in ('true', '1')
 
 
 # Database ENV variables
@@ -25,6 +30,22 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 
 POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", 10))
 POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", 20))
+POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", 30))
+
+POSTGRES_ADMIN_POOL_SIZE = int(os.getenv("POSTGRES_ADMIN_POOL_SIZE", 2))
+POSTGRES_ADMIN_MAX_OVERFLOW = int(os.getenv("POSTGRES_ADMIN_MAX_OVERFLOW", 3))
+POSTGRES_ADMIN_POOL_TIMEOUT = float(os.getenv("POSTGRES_ADMIN_POOL_TIMEOUT", 10))
+
+POSTGRES_BOT_POOL_SIZE = int(os.getenv("POSTGRES_BOT_POOL_SIZE", 5))
+POSTGRES_BOT_MAX_OVERFLOW = int(os.getenv("POSTGRES_BOT_MAX_OVERFLOW", 5))
+POSTGRES_BOT_POOL_TIMEOUT = float(os.getenv("POSTGRES_BOT_POOL_TIMEOUT", 30))
+
+POSTGRES_BACKGROUND_POOL_SIZE = int(os.getenv("POSTGRES_BACKGROUND_POOL_SIZE", 2))
+POSTGRES_BACKGROUND_MAX_OVERFLOW = int(os.getenv("POSTGRES_BACKGROUND_MAX_OVERFLOW", 2))
+POSTGRES_BACKGROUND_POOL_TIMEOUT = float(os.getenv("POSTGRES_BACKGROUND_POOL_TIMEOUT", 60))
+
+POSTGRES_POOL_PRE_PING = os.getenv("POSTGRES_POOL_PRE_PING", "True").lower() in ('true', '1')
+POSTGRES_POOL_RECYCLE = int(os.getenv("POSTGRES_POOL_RECYCLE", 1800))
 
 POSTGRES_ECHO = os.getenv("POSTGRES_ECHO", "False").lower() in ('true', '1')
 
@@ -33,6 +54,7 @@ POSTGRES_ECHO = os.getenv("POSTGRES_ECHO", "False").lower() in ('true', '1')
 SQLADMIN_SECRET_KEY = os.getenv("SQLADMIN_SECRET_KEY")
 SQLADMIN_USERNAME = os.getenv("SQLADMIN_USERNAME")
 SQLADMIN_PASSWORD = os.getenv("SQLADMIN_PASSWORD")
+SQLADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv("SQLADMIN_ESTIMATED_COUNT_THRESHOLD", 100000))
 
 
 # Cache ENV variables
@@ -46,26 +68,110 @@ ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS")
 # TGBot ENV variables
 TGBOT_TOKEN = os.getenv("TGBOT_TOKEN")
 TGBOT_WELCOME_MESSAGE_CACHED_TIME = int(os.getenv("TGBOT_WELCOME_MESSAGE_CACHED_TIME", 60))
+TGBOT_USER_CACHE_SIZE = int(os.getenv("TGBOT_USER_CACHE_SIZE", 100000))
+TGBOT_USER_CACHE_SEC = float(os.getenv("TGBOT_USER_CACHE_SEC", 600))
+TGBOT_SUPERUSER_CACHE_SEC = float(os.getenv("TGBOT_SUPERUSER_CACHE_SEC", 60))
+TGBOT_THROTTLE_RATE = float(os.getenv("TGBOT_THROTTLE_RATE", 1))
+TGBOT_THROTTLE_BURST = float(os.getenv("TGBOT_THROTTLE_BURST", 5))
+TGBOT_THROTTLE_SWEEP_SEC = float(os.getenv("TGBOT_THROTTLE_SWEEP_SEC", 60))
+TGBOT_MODE = os.getenv("TGBOT_MODE", "polling")  # "polling" or "webhook"
+TGBOT_API_URL = os.getenv("TGBOT_API_URL")  # Bot API server, e.g. the local fake one, default is api.telegram.org
+TGBOT_WEBHOOK_URL = os.getenv("TGBOT_WEBHOOK_URL")
+TGBOT_WEBHOOK_PATH = os.getenv("TGBOT_WEBHOOK_PATH", "/tg/webhook")
+TGBOT_WEBHOOK_SECRET = os.getenv("TGBOT_WEBHOOK_SECRET")
+TGBOT_WEBHOOK_HOST = os.getenv("TGBOT_WEBHOOK_HOST", "0.0.0.0")
+TGBOT_WEBHOOK_PORT = int(os.getenv("TGBOT_WEBHOOK_PORT", 8081))
+TGBOT_WEBHOOK_QUEUE_SIZE = int(os.getenv("TGBOT_WEBHOOK_QUEUE_SIZE", 1000))
+TGBOT_WEBHOOK_WORKERS = int(os.getenv("TGBOT_WEBHOOK_WORKERS", 32))
 TGBOT_DEBUG = os.getenv("TGBOT_DEBUG", "False").lower() in ('true', '1')
 TGBOT_USER_ERROR_MESSAGE = os.getenv("TGBOT_USER_ERROR_MESSAGE", "Извините, произошла ошибка. Пожалуйста, попробуйте позже.")
 TGBOT_USER_FALLBACK_GREETING = os.getenv("TGBOT_USER_FALLBACK_GREETING", "Привет, {username}, добро пожаловать!")
+TGBOT_BROADCAST_RATE = float(os.getenv("TGBOT_BROADCAST_RATE", 25))
+TGBOT_BROADCAST_CONCURRENCY = int(os.getenv("TGBOT_BROADCAST_CONCURRENCY", 50))
+TGBOT_BROADCAST_CHAT_INTERVAL_MS = float(os.getenv("TGBOT_BROADCAST_CHAT_INTERVAL_MS", 200))
+TGBOT_BROADCAST_BATCH_SIZE = int(os.getenv("TGBOT_BROADCAST_BATCH_SIZE", 500))
+TGBOT_BROADCAST_CHECKPOINT_SEC = float(os.getenv("TGBOT_BROADCAST_CHECKPOINT_SEC", 5))
+TGBOT_BROADCAST_LEASE_SEC = float(os.getenv("TGBOT_BROADCAST_LEASE_SEC", 60))
+TGBOT_BROADCAST_POLL_SEC = float(os.getenv("TGBOT_BROADCAST_POLL_SEC", 5))
+
+# Logging ENV variables
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", 10))
+LOG_SAMPLE_INTERVAL_SEC = float(os.getenv("LOG_SAMPLE_INTERVAL_SEC", 1))
+
+# User log ingestion ENV variables
+LOG_INGESTION_BATCH_SIZE = int(os.getenv("LOG_INGESTION_BATCH_SIZE", 500))
+LOG_INGESTION_FLUSH_INTERVAL_MS = float(os.getenv("LOG_INGESTION_FLUSH_INTERVAL_MS", 500))
+LOG_INGESTION_MAX_QUEUE_SIZE = int(os.getenv("LOG_INGESTION_MAX_QUEUE_SIZE", 10000))
+LOG_DEDUP_TTL_SEC = float(os.getenv("LOG_DEDUP_TTL_SEC", 5))
+LOG_DEDUP_MAX_KEYS = int(os.getenv("LOG_DEDUP_MAX_KEYS", 50000))
+LOG_DEDUP_AMOUNT_BUCKET_PCT = float(os.getenv("LOG_DEDUP_AMOUNT_BUCKET_PCT", 10))
+LOG_INGESTION_SAMPLE_RATE = float(os.getenv("LOG_INGESTION_SAMPLE_RATE", 1))
+LOG_BULK_MAX_RECORDS = int(os.getenv("LOG_BULK_MAX_RECORDS", 1000))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 10000))
+
+# TG users log partitioning ENV variables
+TG_LOG_PARTITIONS_AHEAD = int(os.getenv("TG_LOG_PARTITIONS_AHEAD", 2))
+TG_LOG_RETENTION_MONTHS = int(os.getenv("TG_LOG_RETENTION_MONTHS", 12))
+TG_LOG_RETENTION_DROP = os.getenv("TG_LOG_RETENTION_DROP", "True").lower() in ('true', '1')
+TG_LOG_MAINTENANCE_INTERVAL_SEC = int(os.getenv("TG_LOG_MAINTENANCE_INTERVAL_SEC", 6 * 60 * 60))
+TG_LOG_ADMIN_RECENT_DAYS = int(os.getenv("TG_LOG_ADMIN_RECENT_DAYS", 30))
+TG_LOG_BACKFILL_BATCH_SIZE = int(os.getenv("TG_LOG_BACKFILL_BATCH_SIZE", 1000))
+
+# User logs rollup ENV variables
+ROLLUP_INTERVAL_SEC = int(os.getenv("ROLLUP_INTERVAL_SEC", 60))
+ROLLUP_LAG_SEC = int(os.getenv("ROLLUP_LAG_SEC", 60))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", 1000))
+
+# Slow query log ENV variables
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 200))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", 100))
+
+# Profiling ENV variables
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ('true', '1')
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 5))
+PROFILING_SLOWEST_STORE_SIZE = int(os.getenv("PROFILING_SLOWEST_STORE_SIZE", 20))
 
 
 class RunConfig(BaseModel):
     host: str = APP_RUN_HOST
     port: int = APP_RUN_PORT
     debug: bool = DEBUG
+    mode: str = APP_MODE
+    import_report: bool = APP_IMPORT_REPORT
 
 
 class APIPrefixConfig(BaseModel):
     prefix: str = "/api"
 
 
+class DBPoolConfig(BaseModel):
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+
+
 class DBConfig(BaseModel):
     url: PostgresDsn = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_ADDRESS}:5432/{POSTGRES_DB}"
     pool_size: int = POSTGRES_POOL_SIZE
     max_overflow: int = POSTGRES_MAX_OVERFLOW
     echo: bool = POSTGRES_ECHO
+    pool_pre_ping: bool = POSTGRES_POOL_PRE_PING
+    pool_recycle: int = POSTGRES_POOL_RECYCLE
+
+    # Separate pools, so admin, bot and background jobs can't starve API (quotes) traffic of connections
+    pools: dict[str, DBPoolConfig] = {
+        "api": DBPoolConfig(pool_size=POSTGRES_POOL_SIZE, max_overflow=POSTGRES_MAX_OVERFLOW,
+                            pool_timeout=POSTGRES_POOL_TIMEOUT),
+        "admin": DBPoolConfig(pool_size=POSTGRES_ADMIN_POOL_SIZE, max_overflow=POSTGRES_ADMIN_MAX_OVERFLOW,
+                              pool_timeout=POSTGRES_ADMIN_POOL_TIMEOUT),
+        "bot": DBPoolConfig(pool_size=POSTGRES_BOT_POOL_SIZE, max_overflow=POSTGRES_BOT_MAX_OVERFLOW,
+                            pool_timeout=POSTGRES_BOT_POOL_TIMEOUT),
+        "background": DBPoolConfig(pool_size=POSTGRES_BACKGROUND_POOL_SIZE,
+                                   max_overflow=POSTGRES_BACKGROUND_MAX_OVERFLOW,
+                                   pool_timeout=POSTGRES_BACKGROUND_POOL_TIMEOUT),
+    }
 
     naming_convention: dict[str, str] = {
         "ix": "ix_%(column_0_label)s",
@@ -80,6 +186,8 @@ class SQLAdminConfig(BaseModel):
     secret_key: str = SQLADMIN_SECRET_KEY
     username: str = SQLADMIN_USERNAME
     password: str = SQLADMIN_PASSWORD
+    estimated_count_threshold: int = SQLADMIN_ESTIMATED_COUNT_THRESHOLD
+    templates_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'admin', 'templates')
 
 
 class CacheConfig(BaseModel):
@@ -100,9 +208,81 @@ class CORSAllowedOriginsConfig(BaseModel):
 class TGBotConfig(BaseModel):
     token: str = TGBOT_TOKEN
     welcome_message_cached_time: int = TGBOT_WELCOME_MESSAGE_CACHED_TIME
+    user_cache_size: int = TGBOT_USER_CACHE_SIZE
+    user_cache_sec: float = TGBOT_USER_CACHE_SEC
+    superuser_cache_sec: float = TGBOT_SUPERUSER_CACHE_SEC
+    throttle_rate: float = TGBOT_THROTTLE_RATE
+    throttle_burst: float = TGBOT_THROTTLE_BURST
+    throttle_sweep_sec: float = TGBOT_THROTTLE_SWEEP_SEC
+    mode: str = TGBOT_MODE
+    api_url: str | None = TGBOT_API_URL
+    webhook_url: str | None = TGBOT_WEBHOOK_URL
+    webhook_path: str = TGBOT_WEBHOOK_PATH
+    webhook_secret: str | None = TGBOT_WEBHOOK_SECRET
+    webhook_host: str = TGBOT_WEBHOOK_HOST
+    webhook_port: int = TGBOT_WEBHOOK_PORT
+    webhook_queue_size: int = TGBOT_WEBHOOK_QUEUE_SIZE
+    webhook_workers: int = TGBOT_WEBHOOK_WORKERS
     debug: bool = TGBOT_DEBUG
     user_error_message: str = TGBOT_USER_ERROR_MESSAGE
     fallback_greeting_user_message: str = TGBOT_USER_FALLBACK_GREETING
+    broadcast_rate: float = TGBOT_BROADCAST_RATE
+    broadcast_concurrency: int = TGBOT_BROADCAST_CONCURRENCY
+    broadcast_chat_interval_ms: float = TGBOT_BROADCAST_CHAT_INTERVAL_MS
+    broadcast_batch_size: int = TGBOT_BROADCAST_BATCH_SIZE
+    broadcast_checkpoint_sec: float = TGBOT_BROADCAST_CHECKPOINT_SEC
+    broadcast_lease_sec: float = TGBOT_BROADCAST_LEASE_SEC
+    broadcast_poll_sec: float = TGBOT_BROADCAST_POLL_SEC
+
+
+class LoggingConfig(BaseModel):
+    queue_size: int = LOG_QUEUE_SIZE
+    sample_limit: int = LOG_SAMPLE_LIMIT
+    sample_interval_sec: float = LOG_SAMPLE_INTERVAL_SEC
+
+
+class LogIngestionConfig(BaseModel):
+    batch_size: int = LOG_INGESTION_BATCH_SIZE
+    flush_interval_ms: float = LOG_INGESTION_FLUSH_INTERVAL_MS
+    max_queue_size: int = LOG_INGESTION_MAX_QUEUE_SIZE
+    dedup_ttl_sec: float = LOG_DEDUP_TTL_SEC
+    dedup_max_keys: int = LOG_DEDUP_MAX_KEYS
+    dedup_amount_bucket_pct: float = LOG_DEDUP_AMOUNT_BUCKET_PCT
+    sample_rate: float = LOG_INGESTION_SAMPLE_RATE
+    bulk_max_records: int = LOG_BULK_MAX_RECORDS
+
+
+class ExportConfig(BaseModel):
+    chunk_size: int = EXPORT_CHUNK_SIZE
+
+
+class TgLogConfig(BaseModel):
+    partitions_ahead: int = TG_LOG_PARTITIONS_AHEAD
+    retention_months: int = TG_LOG_RETENTION_MONTHS
+    retention_drop: bool = TG_LOG_RETENTION_DROP
+    maintenance_interval_sec: int = TG_LOG_MAINTENANCE_INTERVAL_SEC
+    admin_recent_days: int = TG_LOG_ADMIN_RECENT_DAYS
+    backfill_batch_size: int = TG_LOG_BACKFILL_BATCH_SIZE
+
+
+class RollupConfig(BaseModel):
+    interval_sec: int = ROLLUP_INTERVAL_SEC
+    lag_sec: int = ROLLUP_LAG_SEC
+    batch_size: int = ROLLUP_BATCH_SIZE
+
+
+class SlowQueryConfig(BaseModel):
+    threshold_ms: float = SLOW_QUERY_THRESHOLD_MS
+    explain_sample_rate: float = SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    buffer_size: int = SLOW_QUERY_BUFFER_SIZE
+
+
+class ProfilingConfig(BaseModel):
+    enabled: bool = PROFILING_ENABLED
+    sample_interval_ms: float = PROFILING_SAMPLE_INTERVAL_MS
+    slowest_store_size: int = PROFILING_SLOWEST_STORE_SIZE
+    header: str = "X-Profile"
+    query_param: str = "__profile"
 
 
 class Settings(BaseSettings):
@@ -114,6 +294,13 @@ class Settings(BaseSettings):
     media: MediaConfig = MediaConfig()
     cors: CORSAllowedOriginsConfig = CORSAllowedOriginsConfig()
     bot: TGBotConfig = TGBotConfig()
+    logging: LoggingConfig = LoggingConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
+    slow_query: SlowQueryConfig = SlowQueryConfig()
+    log_ingestion: LogIngestionConfig = LogIngestionConfig()
+    tg_log: TgLogConfig = TgLogConfig()
+    export: ExportConfig = ExportConfig()
+    rollup: RollupConfig = RollupConfig()
 
 
 settings = Settings()
@@ -139,9 +326,17 @@ def setup_logging() -> logging.Logger:
     )
     stream_handler.setFormatter(stream_formatter)
 
+    # Records are written by a background thread, not on the event loop
+    queue_handler = make_queue_handler(
+        stream_handler,
+        queue_size=settings.logging.queue_size,
+        sample_limit=settings.logging.sample_limit,
+        sample_interval=settings.logging.sample_interval_sec,
+    )
+
     new_logger = logging.getLogger("APP")
     new_logger.setLevel(log_level)
-    new_logger.addHandler(stream_handler)
+    new_logger.addHandler(queue_handler)
 
     # Hide too many logging information
     class NoFaviconFilter(logging.Filter):
@@ -1,15 +1,22 @@
-__all__ = ["Base", "db_helper", "Currency", "Country", "TransferProvider", "ProviderExchangeRate",
+__all__ = ["Base", "db_helper", "db_pools", "Currency", "Country", "TransferProvider", "ProviderExchangeRate",
            "Document", "TransferRule", "transfer_rule_documents", "TgUser", "TgUserLog",
-           "check_and_update_tables", "WelcomeMessage"]
+           "tg_logs_schema", "WelcomeMessage", "welcome_message_schema", "ensure_schemas",
+           "tg_log_rollups", "tg_log_rollup_watermark",
+           "broadcast_jobs", "broadcast_recipients", "broadcast_job_items", "broadcasts_schema",
+           "bot_fsm_states", "bot_fsm_schema"]
 
 
 from .base import Base
-from .db_helper import db_helper
+from .db_helper import db_helper, db_pools
 from .currency import Currency
 from .country import Country
 from .transfer_provider import TransferProvider
 from .exchange_rate import ProviderExchangeRate
 from .document import Document
 from .transfer_rule import TransferRule, transfer_rule_documents
-from .tg_logg_user import TgUser, TgUserLog, check_and_update_tables
-from .tg_welcome_message import WelcomeMessage
+from .schema_version import ensure_schemas
+from .tg_logg_user import TgUser, TgUserLog, tg_logs_schema
+from .tg_log_rollup import tg_log_rollups, tg_log_rollup_watermark
+from .tg_welcome_message import WelcomeMessage, welcome_message_schema
+from .broadcast_job import broadcast_jobs, broadcast_recipients, broadcast_job_items, broadcasts_schema
+from .bot_fsm_state import bot_fsm_states, bot_fsm_schema
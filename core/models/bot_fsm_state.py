@@ -0,0 +1,28 @@
+"""
+FSM state of the bot conversations (aiogram storage), shared by the bot replicas in webhook mode.
+Hand-managed table, created by the bot on startup.
+"""
+
+from sqlalchemy import Table, Column, String, DateTime, MetaData, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.models.schema_version import HandSchema
+
+metadata_bot_fsm = MetaData()
+
+bot_fsm_states = Table(
+    'bot_fsm_states',
+    metadata_bot_fsm,
+    Column('key', String, primary_key=True),  # Built from aiogram's StorageKey
+    Column('state', String, nullable=True),
+    Column('data', JSONB, nullable=False, server_default=text("'{}'::jsonb")),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+
+async def upgrade_bot_fsm_table(conn: AsyncConnection) -> None:
+    await conn.run_sync(metadata_bot_fsm.create_all)  # Only if missing
+
+
+bot_fsm_schema = HandSchema("bot_fsm", metadata_bot_fsm, upgrade_bot_fsm_table)
@@ -0,0 +1,88 @@
+"""
+Bot broadcasts stored as jobs: the payload and a status for every recipient, so a broadcast survives bot restarts.
+Recipients are split into numbered batches, one row per batch in `broadcast_job_items`; bot workers lease batches
+with `FOR UPDATE SKIP LOCKED`, so several workers send one job without sending anybody twice.
+Hand-managed tables, created by the bot on startup.
+"""
+
+from sqlalchemy import (Table, Column, String, Integer, BigInteger, DateTime, ForeignKey, MetaData, Index, func,
+                        PrimaryKeyConstraint, text)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.models.schema_version import HandSchema, add_missing_columns, add_missing_indexes
+
+# Batches of the jobs created before batching, new jobs use `TGBOT_BROADCAST_BATCH_SIZE`
+UPGRADE_BATCH_SIZE = 500
+
+metadata_broadcast = MetaData()
+
+broadcast_jobs = Table(
+    'broadcast_jobs',
+    metadata_broadcast,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('created_by', String, nullable=False),  # Admin chat id
+    Column('payload', JSONB, nullable=False),
+    Column('status', String(16), nullable=False, server_default='running'),  # "running", "done"
+    # Progress message in the admin chat, edited while the job runs
+    Column('status_chat_id', BigInteger, nullable=True),
+    Column('status_message_id', BigInteger, nullable=True),
+    Column('total', Integer, nullable=False, server_default='0'),
+    Column('sent', Integer, nullable=False, server_default='0'),
+    Column('failed', Integer, nullable=False, server_default='0'),
+    Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column('finished_at', DateTime(timezone=True), nullable=True),
+)
+
+broadcast_recipients = Table(
+    'broadcast_recipients',
+    metadata_broadcast,
+    Column('job_id', Integer, ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), nullable=False),
+    Column('tg_user', String, nullable=False),
+    # "pending", "sending" (claimed, maybe sent), "sent", "failed", "unknown" (was sending when the bot stopped)
+    Column('status', String(8), nullable=False, server_default='pending'),
+    Column('error', String, nullable=True),
+    Column('batch_no', Integer, nullable=True),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    PrimaryKeyConstraint('job_id', 'tg_user'),
+    Index('ix_broadcast_recipients_job_id_batch_no_status', 'job_id', 'batch_no', 'status'),
+)
+
+broadcast_job_items = Table(
+    'broadcast_job_items',
+    metadata_broadcast,
+    Column('job_id', Integer, ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), nullable=False),
+    Column('batch_no', Integer, nullable=False),
+    # "pending", "leased" (a worker is sending it until `lease_until`), "done"
+    Column('status', String(8), nullable=False, server_default='pending'),
+    Column('lease_owner', String, nullable=True),
+    Column('lease_until', DateTime(timezone=True), nullable=True),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    PrimaryKeyConstraint('job_id', 'batch_no'),
+)
+
+
+async def upgrade_broadcast_tables(conn: AsyncConnection) -> None:
+    await conn.run_sync(metadata_broadcast.create_all)  # Only the missing tables
+    await add_missing_columns(conn, metadata_broadcast)
+    await add_missing_indexes(conn, metadata_broadcast)
+    await conn.execute(text("DROP INDEX IF EXISTS ix_broadcast_recipients_job_id_status"))
+
+    # Jobs created before batching: number their recipients and add their batches
+    await conn.execute(text(
+        "UPDATE broadcast_recipients r SET batch_no = n.row_no / :batch_size "
+        "FROM (SELECT job_id, tg_user, row_number() OVER (PARTITION BY job_id ORDER BY tg_user) - 1 AS row_no "
+        "      FROM broadcast_recipients WHERE batch_no IS NULL) n "
+        "WHERE r.job_id = n.job_id AND r.tg_user = n.tg_user"
+    ), {"batch_size": UPGRADE_BATCH_SIZE})
+    await conn.execute(text(
+        "INSERT INTO broadcast_job_items (job_id, batch_no, status) "
+        "SELECT job_id, batch_no, "
+        "       CASE WHEN bool_or(status IN ('pending', 'sending')) THEN 'pending' ELSE 'done' END "
+        "FROM broadcast_recipients GROUP BY job_id, batch_no "
+        "ON CONFLICT DO NOTHING"
+    ))
+
+
+broadcasts_schema = HandSchema("broadcasts", metadata_broadcast, upgrade_broadcast_tables)
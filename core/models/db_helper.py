@@ -1,15 +1,21 @@
 from sqlalchemy.ext.asyncio import (create_async_engine, AsyncEngine,
                                     async_sessionmaker, AsyncSession)
 from core import settings
+from core.config import DBPoolConfig
+from core.slow_query_log import slow_query_log
 
 
 class DataBaseHelper:
-    def __init__(self, url: str, echo: bool, pool_size: int, max_overflow: int):
+    def __init__(self, url: str, echo: bool, pool_size: int, max_overflow: int,
+                 pool_timeout: float = 30, pool_pre_ping: bool = False, pool_recycle: int = -1):
         self.engine: AsyncEngine = create_async_engine(
             url=url,
             echo=echo,
             pool_size=pool_size,
             max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
         )
         self.session_factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
             bind=self.engine,
@@ -26,9 +32,68 @@ class DataBaseHelper:
             yield session
 
 
-db_helper = DataBaseHelper(
+class PoolManager:
+    """
+    Named connection pools (api, admin, bot, background) against the same database. Every pool is
+    a separate engine with its own limits, so e.g. an admin bulk action can't take connections
+    needed by quote traffic. Engines are created on first use, a worker opens only the pools it needs.
+    There are no priorities between the pools: none of them borrows from another, so the reserved size of
+    a pool is what protects its traffic.
+    """
+    def __init__(self, url: str, echo: bool, pools: dict[str, DBPoolConfig],
+                 pool_pre_ping: bool, pool_recycle: int):
+        self.url = url
+        self.echo = echo
+        self.pools_config = pools
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self._helpers: dict[str, DataBaseHelper] = {}
+
+    def get(self, name: str) -> DataBaseHelper:
+        helper = self._helpers.get(name)
+        if helper is None:
+            config = self.pools_config[name]
+            helper = DataBaseHelper(
+                url=self.url,
+                echo=self.echo,
+                pool_size=config.pool_size,
+                max_overflow=config.max_overflow,
+                pool_timeout=config.pool_timeout,
+                pool_pre_ping=self.pool_pre_ping,
+                pool_recycle=self.pool_recycle,
+            )
+            slow_query_log.install(helper.engine)
+            self._helpers[name] = helper
+        return helper
+
+    def stats(self) -> list[dict]:
+        stats = []
+        for name, config in self.pools_config.items():
+            helper = self._helpers.get(name)
+            pool = helper.engine.pool if helper else None
+            stats.append({
+                "name": name,
+                "created": helper is not None,
+                "pool_size": config.pool_size,
+                "max_overflow": config.max_overflow,
+                "pool_timeout": config.pool_timeout,
+                "checked_out": pool.checkedout() if pool else 0,
+                "checked_in": pool.checkedin() if pool else 0,
+                "overflow": pool.overflow() if pool else 0,
+            })
+        return stats
+
+    async def dispose(self) -> None:
+        for helper in self._helpers.values():
+            await helper.dispose()
+
+
+db_pools = PoolManager(
     url=settings.db.url,
     echo=settings.db.echo,
-    pool_size=settings.db.pool_size,
-    max_overflow=settings.db.max_overflow
+    pools=settings.db.pools,
+    pool_pre_ping=settings.db.pool_pre_ping,
+    pool_recycle=settings.db.pool_recycle,
 )
+
+db_helper = db_pools.get("api")
@@ -0,0 +1,118 @@
+"""
+Versioning of the hand-managed tables (not in alembic). Every group of tables has a hash of its DDL stored
+in `hand_schema_versions`; on startup all hashes are read in one query and the upgrade (create tables, add columns,
+hand-written DDL) runs only for groups whose hash differs, so a normal boot does no introspection and takes no locks.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from sqlalchemy import text, inspect, Column, MetaData, Table
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from core import logger
+
+VERSION_TABLE = "hand_schema_versions"
+# Any constant, shared by all workers, so only one of them upgrades the schema
+SCHEMA_LOCK_KEY = 7_342_004
+
+
+@dataclass
+class HandSchema:
+    """
+    :param name: Key in the version table
+    :param metadata: Tables of the group, their DDL is hashed
+    :param upgrade: Brings the database to the metadata, idempotent, runs in the caller's transaction
+    :param revision: Bump it when the upgrade changes without changes in the metadata (hand-written DDL)
+    """
+    name: str
+    metadata: MetaData
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+    revision: int = 1
+
+    def schema_hash(self) -> str:
+        dialect = postgresql.dialect()
+        ddl = [f"revision {self.revision}"]
+        for table in self.metadata.sorted_tables:
+            ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+            ddl.extend(str(CreateIndex(index).compile(dialect=dialect))
+                       for index in sorted(table.indexes, key=lambda index: index.name or ""))
+        return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
+async def add_missing_columns(conn: AsyncConnection, metadata: MetaData) -> None:
+    def missing_columns(sync_conn) -> list[tuple[Table, Column]]:
+        inspector = inspect(sync_conn)
+        missing = []
+        for table in metadata.sorted_tables:
+            existing_column_names = {col['name'] for col in inspector.get_columns(table.name)}
+            missing.extend((table, column) for column in table.columns if column.name not in existing_column_names)
+        return missing
+
+    for table, column in await conn.run_sync(missing_columns):
+        definition = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+        if column.server_default is not None:
+            default = column.server_default.arg
+            if isinstance(default, str):
+                default = "'" + default.replace("'", "''") + "'"
+            else:
+                default = str(default.compile(dialect=conn.dialect))
+            # Constant default, existing rows get it without a table rewrite
+            definition += f" NOT NULL DEFAULT {default}" if not column.nullable else f" DEFAULT {default}"
+        await conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+        logger.warning(f"Added column {column.name} to table {table.name}")
+
+
+async def add_missing_indexes(conn: AsyncConnection, metadata: MetaData) -> None:
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            await conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def _stored_hashes(engine: AsyncEngine) -> dict[str, str]:
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text(f"SELECT name, hash FROM {VERSION_TABLE}"))
+            return dict(result.all())
+    except DBAPIError:
+        return {}  # No version table yet, first start
+
+
+async def ensure_schemas(engine: AsyncEngine, *schemas: HandSchema) -> list[str]:
+    """
+    Upgrade the groups whose stored hash differs from the current one.
+
+    :return: Names of the upgraded groups
+    """
+    stored = await _stored_hashes(engine)
+    outdated = [schema for schema in schemas if stored.get(schema.name) != schema.schema_hash()]
+    if not outdated:
+        return []
+
+    async with engine.begin() as conn:
+        # Workers started together wait here, the first one upgrades, the others find the new hashes
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+            f"(name VARCHAR PRIMARY KEY, hash VARCHAR NOT NULL, updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        result = await conn.execute(text(f"SELECT name, hash FROM {VERSION_TABLE}"))
+        stored = dict(result.all())
+
+        upgraded = []
+        for schema in outdated:
+            schema_hash = schema.schema_hash()
+            if stored.get(schema.name) == schema_hash:
+                continue
+            await schema.upgrade(conn)
+            await conn.execute(text(
+                f"INSERT INTO {VERSION_TABLE} (name, hash) VALUES (:name, :hash) "
+                f"ON CONFLICT (name) DO UPDATE SET hash = EXCLUDED.hash, updated_at = now()"
+            ), {"name": schema.name, "hash": schema_hash})
+            upgraded.append(schema.name)
+            logger.warning("Upgraded hand-managed schema %s", schema.name)
+    return upgraded
@@ -0,0 +1,113 @@
+"""
+Typed compact columns of `tg_users_log` for tables created before they existed: constraints the generic
+`add_missing_columns` can't add, and a batched backfill converting the free-form string columns of old rows.
+"""
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from core import logger, settings
+
+# Any constant, shared by all workers, so only one of them runs the backfill
+BACKFILL_LOCK_KEY = 7_342_003
+
+AMOUNT_PATTERN = r"^\s*-?\d+([.,]\d+)?\s*$"
+
+
+async def ensure_compact_schema(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TABLE tg_users_log ALTER COLUMN tg_user DROP NOT NULL"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tg_users_log_user_id ON tg_users_log (user_id)"))
+    await conn.execute(text("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conname = 'tg_users_log_user_id_fkey' AND conrelid = 'tg_users_log'::regclass
+            ) THEN
+                ALTER TABLE tg_users_log ADD CONSTRAINT tg_users_log_user_id_fkey
+                    FOREIGN KEY (user_id) REFERENCES tg_users (id) ON DELETE CASCADE;
+            END IF;
+        END $$;
+    """))
+
+
+# Resolve typed values of the batch rows, currencies and countries match by id, abbreviation or name
+_backfill_typed = text(f"""
+    WITH batch AS (
+        SELECT id, created_at FROM tg_users_log
+        WHERE user_id IS NULL AND id > :last_id
+        ORDER BY id
+        LIMIT :batch_size
+    )
+    UPDATE tg_users_log AS log SET
+        user_id = (SELECT u.id FROM tg_users u WHERE u.tg_user = log.tg_user),
+        amount = COALESCE(log.amount, CASE WHEN log.amount_log ~ '{AMOUNT_PATTERN}'
+                                           THEN replace(trim(log.amount_log), ',', '.')::numeric END),
+        currency_id = COALESCE(log.currency_id, (
+            SELECT c.id FROM currencies c
+            WHERE c.id::text = log.currency_log OR upper(c.abbreviation) = upper(log.currency_log)
+                  OR lower(c.name) = lower(log.currency_log)
+            LIMIT 1)),
+        send_country_id = COALESCE(log.send_country_id, (
+            SELECT c.id FROM countries c
+            WHERE c.id::text = log.send_country_log OR upper(c.abbreviation) = upper(log.send_country_log)
+                  OR lower(c.name) = lower(log.send_country_log)
+            LIMIT 1)),
+        receive_country_id = COALESCE(log.receive_country_id, (
+            SELECT c.id FROM countries c
+            WHERE c.id::text = log.receive_country_log OR upper(c.abbreviation) = upper(log.receive_country_log)
+                  OR lower(c.name) = lower(log.receive_country_log)
+            LIMIT 1))
+    FROM batch
+    WHERE log.id = batch.id AND log.created_at = batch.created_at
+    RETURNING log.id
+""")
+
+# Drop the string values which got their typed copy
+_backfill_clear = text("""
+    UPDATE tg_users_log SET
+        tg_user = CASE WHEN user_id IS NULL THEN tg_user END,
+        amount_log = CASE WHEN amount IS NULL THEN amount_log END,
+        currency_log = CASE WHEN currency_id IS NULL THEN currency_log END,
+        send_country_log = CASE WHEN send_country_id IS NULL THEN send_country_log END,
+        receive_country_log = CASE WHEN receive_country_id IS NULL THEN receive_country_log END
+    WHERE id = ANY(:ids)
+""")
+
+
+async def backfill_compact_columns(engine: AsyncEngine) -> int:
+    """
+    Convert old rows batch by batch, every batch in its own short transaction.
+
+    :return: Number of converted rows
+    """
+    last_id, converted = 0, 0
+    while True:
+        async with engine.begin() as conn:
+            locked = await conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": BACKFILL_LOCK_KEY})
+            if not locked.scalar():
+                return converted
+
+            result = await conn.execute(_backfill_typed, {"last_id": last_id,
+                                                          "batch_size": settings.tg_log.backfill_batch_size})
+            ids = list(result.scalars().all())
+            if not ids:
+                break
+            await conn.execute(_backfill_clear, {"ids": ids})
+
+        last_id = max(ids)
+        converted += len(ids)
+
+    if converted:
+        logger.warning("Converted %d tg_users_log rows to the typed columns", converted)
+    return converted
+
+
+async def run_compact_backfill(engine: AsyncEngine) -> None:
+    """
+    One-off background task for the app lifespan.
+    """
+    try:
+        await backfill_compact_columns(engine)
+    except Exception as e:
+        logger.error("Error in tg_users_log typed columns backfill: %s", e)
@@ -0,0 +1,161 @@
+"""
+Monthly range partitioning of `tg_users_log` by `created_at`: upcoming partitions are created ahead of time,
+partitions older than the retention period are detached (and dropped). An existing plain table is converted
+in place by attaching it as the partition for everything before the next month, so no rows are copied.
+"""
+
+import asyncio
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from core import logger, settings
+
+LOG_TABLE = "tg_users_log"
+DEFAULT_PARTITION = f"{LOG_TABLE}_default"
+# Any constant, shared by all workers, so only one of them runs partition DDL at a time
+PARTITION_LOCK_KEY = 7_342_001
+
+_partition_name = re.compile(rf"^{LOG_TABLE}_(?:before_)?y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(day: date, shift: int = 0) -> date:
+    months = day.year * 12 + day.month - 1 + shift
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{LOG_TABLE}_y{month.year}m{month.month:02d}"
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    # relkind is a "char", asyncpg returns it as bytes
+    result = await conn.execute(text("SELECT relkind::text = 'p' FROM pg_class WHERE relname = :name"),
+                                {"name": LOG_TABLE})
+    return bool(result.scalar_one_or_none())
+
+
+async def convert_to_partitioned(conn: AsyncConnection) -> None:
+    """
+    Rename the plain table, create the partitioned one and attach the old table as a partition
+    for (MINVALUE, next month), rows of the current month included.
+    """
+    first_month = month_start(datetime.now(timezone.utc).date(), 1)
+    legacy = f"{LOG_TABLE}_before_y{first_month.year}m{first_month.month:02d}"
+
+    await conn.execute(text(f"ALTER TABLE {LOG_TABLE} RENAME TO {legacy}"))
+    await conn.execute(text(f"UPDATE {legacy} SET created_at = now() WHERE created_at IS NULL"))
+    await conn.execute(text(f"ALTER TABLE {legacy} ALTER COLUMN created_at SET NOT NULL"))
+    # Index names (pkey included) are per schema, the new table needs them
+    indexes = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :name"), {"name": legacy})
+    for index in indexes.scalars().all():
+        if LOG_TABLE in index:
+            await conn.execute(text(f"ALTER INDEX {index} RENAME TO {index.replace(LOG_TABLE, legacy, 1)}"))
+    # A partition can't have a primary key other than the parent's (id, created_at)
+    pkey = await conn.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:name AS regclass) AND contype = 'p'"
+    ), {"name": legacy})
+    pkey_name = pkey.scalar_one_or_none()
+    if pkey_name is not None:
+        await conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT {pkey_name}"))
+    await conn.execute(text(f"ALTER TABLE {legacy} ADD PRIMARY KEY (id, created_at)"))
+
+    from core.models.tg_logg_user import tg_users_log
+    await conn.run_sync(tg_users_log.create)
+
+    await conn.execute(text(
+        f"ALTER TABLE {LOG_TABLE} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()}')"
+    ))
+    await conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{LOG_TABLE}', 'id'), "
+        f"(SELECT COALESCE(max(id), 0) + 1 FROM {legacy}), false)"
+    ))
+    logger.warning("Converted %s to a partitioned table, old rows are in %s", LOG_TABLE, legacy)
+
+
+async def list_partitions(conn: AsyncConnection) -> list[str]:
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :name ORDER BY child.relname"
+    ), {"name": LOG_TABLE})
+    return list(result.scalars().all())
+
+
+async def create_partitions(conn: AsyncConnection, months_ahead: int) -> None:
+    # DDL only for the missing ones, it locks the parent table
+    existing = set(await list_partitions(conn))
+    current = month_start(datetime.now(timezone.utc).date())
+    # Months before the end of the converted table's partition are in it
+    covered_until = max((date(int(match.group(1)), int(match.group(2)), 1)
+                         for match in map(_partition_name.match, existing)
+                         if match and match.group(0).startswith(f"{LOG_TABLE}_before_")), default=current)
+    for shift in range(months_ahead + 1):
+        start, end = month_start(current, shift), month_start(current, shift + 1)
+        if partition_name(start) in existing or start < covered_until:
+            continue
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {LOG_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+    if DEFAULT_PARTITION not in existing:
+        await conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {LOG_TABLE} DEFAULT"))
+
+
+async def apply_retention(conn: AsyncConnection, retention_months: int, drop: bool) -> None:
+    """
+    Detach (and drop) partitions whose whole range is older than `retention_months`.
+    """
+    if retention_months <= 0:
+        return
+    cutoff = month_start(datetime.now(timezone.utc).date(), -retention_months)
+    for name in await list_partitions(conn):
+        match = _partition_name.match(name)
+        if not match:
+            continue
+        start = date(int(match.group(1)), int(match.group(2)), 1)
+        # "before_" partitions end where their name starts, monthly ones a month later
+        end = start if name.startswith(f"{LOG_TABLE}_before_") else month_start(start, 1)
+        if end > cutoff:
+            continue
+        await conn.execute(text(f"ALTER TABLE {LOG_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.warning("Retention: %s partition %s", "dropped" if drop else "detached", name)
+
+
+async def apply_partitioning(conn: AsyncConnection) -> None:
+    """
+    Convert the table if needed, create upcoming partitions and apply retention.
+    """
+    if not await is_partitioned(conn):
+        await convert_to_partitioned(conn)
+    await create_partitions(conn, settings.tg_log.partitions_ahead)
+    await apply_retention(conn, settings.tg_log.retention_months, settings.tg_log.retention_drop)
+
+
+async def maintain_partitions(engine: AsyncEngine) -> None:
+    """
+    `apply_partitioning` in its own transaction, does nothing if another worker holds the lock.
+    """
+    async with engine.begin() as conn:
+        locked = await conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+        if not locked.scalar():
+            return
+        await apply_partitioning(conn)
+
+
+async def run_partition_maintenance(engine: AsyncEngine) -> None:
+    """
+    Background loop for the app lifespan, runs maintenance on start and every `maintenance_interval_sec`.
+    """
+    while True:
+        try:
+            await maintain_partitions(engine)
+        except Exception as e:
+            logger.error("Error in %s partition maintenance: %s", LOG_TABLE, e)
+        await asyncio.sleep(settings.tg_log.maintenance_interval_sec)
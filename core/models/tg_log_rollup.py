@@ -0,0 +1,35 @@
+from sqlalchemy import Table, Column, String, Integer, BigInteger, DateTime, Float, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
+
+from core.models.tg_logg_user import metadata_logg
+
+
+# Corridor demand aggregated from tg_users_log per hour and per day
+tg_log_rollups = Table(
+    'tg_log_rollups',
+    metadata_logg,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('granularity', String(8), nullable=False),  # "hour" or "day"
+    Column('bucket_start', DateTime(timezone=True), nullable=False),
+    Column('send_country', String, nullable=False, server_default=''),
+    Column('receive_country', String, nullable=False, server_default=''),
+    Column('currency', String, nullable=False, server_default=''),
+    Column('count', BigInteger, nullable=False, server_default='0'),
+    Column('amount_count', BigInteger, nullable=False, server_default='0'),
+    Column('amount_sum', Float, nullable=False, server_default='0'),
+    Column('amount_min', Float, nullable=True),
+    Column('amount_max', Float, nullable=True),
+    Column('amount_sketch', JSONB, nullable=True),  # utils.QuantileSketch
+    UniqueConstraint('granularity', 'bucket_start', 'send_country', 'receive_country', 'currency',
+                     name='uq_tg_log_rollups_bucket'),
+    Index('ix_tg_log_rollups_granularity_bucket_start', 'granularity', 'bucket_start'),
+)
+
+# Single row, id of the last tg_users_log row included in the rollups
+tg_log_rollup_watermark = Table(
+    'tg_log_rollup_watermark',
+    metadata_logg,
+    Column('id', Integer, primary_key=True),
+    Column('last_log_id', BigInteger, nullable=False, server_default='0'),
+    Column('updated_at', DateTime(timezone=True), nullable=True),
+)
@@ -1,7 +1,14 @@
-from sqlalchemy import Table, Column, String, Integer, DateTime, func, ForeignKey, MetaData, inspect, text, Boolean
+from sqlalchemy import (Table, Column, String, Integer, DateTime, func, ForeignKey, MetaData, text, Boolean,
+                        Numeric, Index)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
+from core.models.tg_log_backfill import ensure_compact_schema
+from core.models.tg_log_partitions import apply_partitioning, PARTITION_LOCK_KEY
+from core.models.schema_version import HandSchema, add_missing_columns, add_missing_indexes
+
 metadata_logg = MetaData()
 
 tg_users = Table(
@@ -12,19 +19,40 @@ tg_users = Table(
     Column('username', String, nullable=True, unique=True, index=True),
     Column('created_at', DateTime(timezone=True), server_default=func.now()),
     Column('is_superuser', Boolean, default=False, nullable=False),
+    # Reachability by the bot: "active", or why messages can't be delivered ("blocked", "deactivated", "not_found").
+    # Set by broadcasts, back to "active" when the user presses /start
+    Column('status', String(16), nullable=False, server_default=text("'active'")),
+    # Last failed delivery, also transient ones that don't change the status
+    Column('last_failure_at', DateTime(timezone=True), nullable=True),
+    Column('last_failure_reason', String, nullable=True),
+    # Broadcast recipients are the active users in tg_user order
+    Index('ix_tg_users_active_tg_user', 'tg_user', postgresql_where=text("status = 'active'")),
 )
 
 tg_users_log = Table(
     'tg_users_log',
     metadata_logg,
     Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('tg_user', String, ForeignKey('tg_users.tg_user'), nullable=False, index=True),
+    # Legacy free-form columns, new rows fill them only with values that couldn't be resolved to the typed ones
+    Column('tg_user', String, ForeignKey('tg_users.tg_user'), nullable=True, index=True),
     Column('url_log', String, nullable=False),
     Column('amount_log', String, nullable=True),
     Column('currency_log', String, nullable=True),
     Column('send_country_log', String, nullable=True),
     Column('receive_country_log', String, nullable=True),
-    Column('created_at', DateTime(timezone=True), server_default=func.now()),
+    # Typed compact columns, currency and countries are ids from `currencies` and `countries` (no FK, logs outlive them)
+    Column('user_id', Integer, ForeignKey('tg_users.id', ondelete='CASCADE'), nullable=True, index=True),
+    Column('amount', Numeric(18, 2), nullable=True),
+    Column('currency_id', UUID(as_uuid=True), nullable=True),
+    Column('send_country_id', UUID(as_uuid=True), nullable=True),
+    Column('receive_country_id', UUID(as_uuid=True), nullable=True),
+    # Number of logs the row stands for (repeats folded by the ingestion dedup window and sampling)
+    Column('repeat_count', Integer, nullable=False, server_default=text('1')),
+    # Partition key, has to be a part of the primary key
+    Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True),
+    # Admin lists page by keyset on (created_at, id)
+    Index('ix_tg_users_log_created_at_id', 'created_at', 'id'),
+    postgresql_partition_by='RANGE (created_at)',
 )
 
 Base_2 = declarative_base(metadata=metadata_logg)
@@ -32,13 +60,16 @@ Base_2 = declarative_base(metadata=metadata_logg)
 
 class TgUser(Base_2):
     __table__ = tg_users
-    logs = relationship("TgUserLog", back_populates="user", lazy='noload')
+    logs = relationship("TgUserLog", back_populates="user", lazy='noload', foreign_keys=[tg_users_log.c.user_id])
 
     id = __table__.c.id
     tg_user = __table__.c.tg_user
     username = __table__.c.username
     created_at = __table__.c.created_at
     is_superuser = __table__.c.is_superuser
+    status = __table__.c.status
+    last_failure_at = __table__.c.last_failure_at
+    last_failure_reason = __table__.c.last_failure_reason
 
     def __repr__(self):
         return f"{self.tg_user}"
@@ -49,7 +80,9 @@ class TgUser(Base_2):
 
 class TgUserLog(Base_2):
     __table__ = tg_users_log
-    user = relationship("TgUser", back_populates="logs")
+    # id is unique by itself (one sequence for all partitions), created_at is in the table's PK only for partitioning
+    __mapper_args__ = {"primary_key": [tg_users_log.c.id]}
+    user = relationship("TgUser", back_populates="logs", foreign_keys=[tg_users_log.c.user_id])
 
     id = __table__.c.id
     tg_user = __table__.c.tg_user
@@ -58,6 +91,12 @@ class TgUserLog(Base_2):
     currency_log = __table__.c.currency_log
     send_country_log = __table__.c.send_country_log
     receive_country_log = __table__.c.receive_country_log
+    user_id = __table__.c.user_id
+    amount = __table__.c.amount
+    currency_id = __table__.c.currency_id
+    send_country_id = __table__.c.send_country_id
+    receive_country_id = __table__.c.receive_country_id
+    repeat_count = __table__.c.repeat_count
     created_at = __table__.c.created_at
 
     def __repr__(self):
@@ -67,25 +106,15 @@ class TgUserLog(Base_2):
         return f"(id={self.id}, url_log={self.url_log}, created_at={self.created_at})"
 
 
-async def add_missing_columns(engine):
-    async with engine.begin() as conn:
-        inspector = await conn.run_sync(inspect)
-        for table in metadata_logg.sorted_tables:
-            existing_columns = await conn.run_sync(lambda sync_conn: inspector.get_columns(table.name))
-            existing_column_names = {col['name'] for col in existing_columns}
-            for column in table.columns:
-                if column.name not in existing_column_names:
-                    alter_stmt = text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type}")
-                    await conn.execute(alter_stmt)
-                    print(f"Added column {column.name} to table {table.name}")
-
-
-async def check_and_update_tables(engine):
-    async with engine.begin() as conn:
-        inspector = await conn.run_sync(inspect)
-        for table in metadata_logg.sorted_tables:
-            if not await conn.run_sync(lambda sync_conn: inspector.has_table(table.name)):
-                await conn.run_sync(metadata_logg.create_all)
-                print(f"Created table {table.name}")
-            else:
-                await add_missing_columns(engine)
+async def upgrade_log_tables(conn: AsyncConnection) -> None:
+    await conn.run_sync(metadata_logg.create_all)  # Only the missing tables
+    await add_missing_columns(conn, metadata_logg)
+    await add_missing_indexes(conn, metadata_logg)
+    # Constraints of the typed columns for tables created before them
+    await ensure_compact_schema(conn)
+    # Logs are partitioned by month, convert the old table and create the partitions
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    await apply_partitioning(conn)
+
+
+tg_logs_schema = HandSchema("tg_logs", metadata_logg, upgrade_log_tables)
@@ -1,9 +1,9 @@
-from async_lru import alru_cache
-from sqlalchemy import Table, Column, String, MetaData, inspect, Integer, select
+from sqlalchemy import Table, Column, String, MetaData, Integer, select
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.ext.declarative import declarative_base
 
-from core import settings
-from bot.bot_logger import logger
+from core import settings, logger
+from core.models.schema_version import HandSchema
 
 metadata_welcome_message = MetaData()
 
@@ -30,8 +30,10 @@ class WelcomeMessage(Base_3):
         return self.text
 
     @classmethod
-    @alru_cache(maxsize=1, ttl=settings.bot.welcome_message_cached_time)
     async def get_message(cls, session):
+        """
+        Not cached, the bot keeps it in `bot.cache.bot_cache`.
+        """
         default_message = settings.bot.fallback_greeting_user_message
         try:
             result = await session.execute(select(cls))
@@ -43,12 +45,8 @@ class WelcomeMessage(Base_3):
             return default_message
 
 
-async def check_table(engine):
-    async with engine.begin() as conn:
-        inspector = await conn.run_sync(inspect)
-        for table in metadata_welcome_message.sorted_tables:
-            if not await conn.run_sync(lambda sync_conn: inspector.has_table(table.name)):
-                await conn.run_sync(metadata_welcome_message.create_all)
-                print(f"Created table {table.name}")
-            else:
-                logger.info(f"Table {table.name} already exists.")
+async def upgrade_welcome_message_table(conn: AsyncConnection) -> None:
+    await conn.run_sync(metadata_welcome_message.create_all)  # Only if missing
+
+
+welcome_message_schema = HandSchema("welcome_message", metadata_welcome_message, upgrade_welcome_message_table)
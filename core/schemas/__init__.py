@@ -1,7 +1,8 @@
 __all__ = ["ProviderResponse", "CurrencyResponse", "CountryResponse", "ExchangeRateResponse",
            "TransferRuleDetails", "DetailedTransferRuleResponse",
            "OptimizedTransferRuleResponse", "DocumentResponse", "TimeDeltaInfo",
-           "TgUserCreate", "TgUserLogCreate",
+           "TgUserCreate", "TgUserLogCreate", "TgUserLogBulkItemStatus", "TgUserLogBulkResponse",
+           "CorridorDemand", "CorridorDemandResponse",
            ]
 
 
@@ -12,4 +13,5 @@ from .provider import ProviderResponse
 from .transfer_rule import TransferRuleDetails, DetailedTransferRuleResponse, OptimizedTransferRuleResponse
 from .exchange_rate import ExchangeRateResponse
 from .time_delta_info import TimeDeltaInfo
-from .tg_user import TgUserCreate, TgUserLogCreate
+from .tg_user import TgUserCreate, TgUserLogCreate, TgUserLogBulkItemStatus, TgUserLogBulkResponse
+from .corridor_demand import CorridorDemand, CorridorDemandResponse
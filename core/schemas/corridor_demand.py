@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Optional, List
+
+from pydantic import BaseModel
+
+
+class CorridorDemand(BaseModel):
+    send_country: str
+    receive_country: str
+    currency: str
+    bucket_start: Optional[datetime] = None
+    count: int
+    amount_count: int
+    amount_avg: Optional[float] = None
+    amount_min: Optional[float] = None
+    amount_max: Optional[float] = None
+    amount_p50: Optional[float] = None
+    amount_p90: Optional[float] = None
+    amount_p99: Optional[float] = None
+
+
+class CorridorDemandResponse(BaseModel):
+    granularity: str
+    date_from: datetime
+    date_to: datetime
+    watermark_at: Optional[datetime] = None
+    items: List[CorridorDemand]
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, List
 
 from pydantic import BaseModel, Field
 
@@ -14,3 +14,15 @@ class TgUserLogCreate(BaseModel):
     currency_log: Optional[str] = Field(default=None)
     send_country_log: Optional[str] = Field(default=None)
     receive_country_log: Optional[str] = Field(default=None)
+
+
+class TgUserLogBulkItemStatus(BaseModel):
+    index: int
+    status: str  # "created", "invalid" or "unknown_user"
+    errors: Optional[List[str]] = Field(default=None)
+
+
+class TgUserLogBulkResponse(BaseModel):
+    created: int
+    rejected: int
+    items: List[TgUserLogBulkItemStatus]
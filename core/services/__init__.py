@@ -1,7 +1,20 @@
 __all__ = [
     'CurrencyConversionService',
-    'get_object_by_id'
+    'get_object_by_id',
+    'SamplingProfiler',
+    'RequestProfile',
+    'slowest_requests_store',
+    'tg_user_log_ingestion',
+    'log_compactor',
+    'upsert_tg_user',
+    'RollupBucket',
+    'run_rollup_job',
 ]
 
 from .currency_conversion_service import CurrencyConversionService
 from .get_object import get_object_by_id
+from .request_profiler import SamplingProfiler, RequestProfile, slowest_requests_store
+from .log_compaction import log_compactor
+from .log_ingestion import tg_user_log_ingestion
+from .tg_user_registration import upsert_tg_user
+from .log_rollup import RollupBucket, run_rollup_job
@@ -41,7 +41,7 @@ class CurrencyConversionService:
 
         # Check if conversion is needed
         if to_currency.id == from_currency.id:
-            logger.info(f"No conversion needed: {from_currency.abbreviation} to {to_currency.abbreviation}")
+            logger.debug("No conversion needed: %s to %s", from_currency.abbreviation, to_currency.abbreviation)
             return original_amount, 1.0, [from_currency.abbreviation]
 
         # Get USD currency, to avoid multiple queries result stores in cache
@@ -57,8 +57,8 @@ class CurrencyConversionService:
             converted_amount = round(original_amount * direct_rate, 2)
             exchange_rate = round(direct_rate, 4)
             conversion_path = [from_currency.abbreviation, to_currency.abbreviation]
-            logger.info(f"Direct conversion successful: {original_amount} {from_currency.abbreviation} = "
-                        f"{converted_amount} {to_currency.abbreviation}")
+            logger.debug("Direct conversion successful: %s %s = %s %s", original_amount, from_currency.abbreviation,
+                         converted_amount, to_currency.abbreviation)
             return converted_amount, exchange_rate, conversion_path
 
         # If direct conversion is not available, try USD as an intermediate currency
@@ -69,12 +69,13 @@ class CurrencyConversionService:
             converted_amount = round(amount_in_usd * rate_from_usd, 2)
             exchange_rate = round(rate_to_usd * rate_from_usd, 4)
             conversion_path = [from_currency.abbreviation, "USD", to_currency.abbreviation]
-            logger.info(
-                f"USD conversion successful: {original_amount} {from_currency.abbreviation} = {converted_amount} {to_currency.abbreviation}")
+            logger.debug("USD conversion successful: %s %s = %s %s", original_amount, from_currency.abbreviation,
+                         converted_amount, to_currency.abbreviation)
             return converted_amount, exchange_rate, conversion_path
 
         # If no conversion path is found, raise an exception
-        logger.error(f"Unable to perform currency conversion from {from_currency.abbreviation} to {to_currency.abbreviation}")
+        logger.warning("Unable to perform currency conversion from %s to %s",
+                       from_currency.abbreviation, to_currency.abbreviation)
         raise HTTPException(status_code=400, detail="Unable to perform currency conversion")
 
     @staticmethod
@@ -87,7 +88,7 @@ class CurrencyConversionService:
                 raise HTTPException(status_code=404, detail="Active USD currency not found in the database")
             return usd_currency
         except SQLAlchemyError as e:
-            logger.error(f"Database error: {str(e)}")
+            logger.error("Database error: %s", e)
             raise HTTPException(status_code=500, detail="Internal server error")
 
     @staticmethod
@@ -111,6 +112,6 @@ class CurrencyConversionService:
             result = await session.execute(query)
             rates = result.scalars().all()
         except SQLAlchemyError as e:
-            logger.error(f"Database error: {str(e)}")
+            logger.error("Database error: %s", e)
             raise HTTPException(status_code=500, detail="Internal server error")
         return {(rate.from_currency_id, rate.to_currency_id): rate.rate for rate in rates}
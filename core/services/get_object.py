@@ -39,7 +39,7 @@ async def get_object_by_id(session: AsyncSession, model, _id: UUID):
         raise HTTPException(status_code=500, detail=f"Error retrieving {model.__name__} with id: {_id}")
 
     if obj:
-        logger.info(f"Found active {model.__name__}: {obj.id}")
+        logger.info("Found active %s: %s", model.__name__, obj.id)
         return obj
     else:
         logger.warning(f"Active {model.__name__} not found for id: {_id}")
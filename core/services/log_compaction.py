@@ -0,0 +1,121 @@
+import time
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import settings
+from core.models import Currency, Country, TgUser
+from core.models.tg_logg_user import tg_users_log
+
+
+class LogCompactor:
+    """
+    Converts incoming user logs to the compact form of `tg_users_log`: user id, numeric amount and
+    currency / country ids. Strings which can't be resolved are kept in the legacy `*_log` columns.
+    Currencies and countries are few, they are cached in memory for `ttl` seconds.
+    """
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._currencies: dict[str, UUID] = {}
+        self._countries: dict[str, UUID] = {}
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _lookup_keys(obj) -> list[str]:
+        return [str(obj.id), obj.abbreviation.upper(), obj.name.lower()]
+
+    async def _refresh(self, session: AsyncSession) -> None:
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return
+        currencies = (await session.execute(select(Currency.id, Currency.abbreviation, Currency.name))).all()
+        countries = (await session.execute(select(Country.id, Country.abbreviation, Country.name))).all()
+        self._currencies = {key: row.id for row in currencies for key in self._lookup_keys(row)}
+        self._countries = {key: row.id for row in countries for key in self._lookup_keys(row)}
+        self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _resolve(mapping: dict[str, UUID], value: str | None) -> UUID | None:
+        if not value:
+            return None
+        value = value.strip()
+        return mapping.get(value) or mapping.get(value.upper()) or mapping.get(value.lower())
+
+    @staticmethod
+    def parse_amount(value: str | None) -> Decimal | None:
+        if not value:
+            return None
+        try:
+            amount = Decimal(value.strip().replace(",", "."))
+        except InvalidOperation:
+            return None
+        return amount.quantize(Decimal("0.01")) if amount.is_finite() else None
+
+    async def compact(self, session: AsyncSession, entries: list[dict]) -> tuple[list[dict], list[int]]:
+        """
+        :param session: Async database session
+        :param entries: Logs as `TgUserLogCreate` dicts (plus optional created_at)
+        :return: Rows ready for insert, indexes of the entries of unknown users (skipped)
+        """
+        await self._refresh(session)
+        result = await session.execute(
+            select(TgUser.tg_user, TgUser.id).where(TgUser.tg_user.in_({entry["tg_user"] for entry in entries}))
+        )
+        users = dict(result.all())
+
+        rows, unknown = [], []
+        for index, entry in enumerate(entries):
+            user_id = users.get(entry["tg_user"])
+            if user_id is None:
+                unknown.append(index)
+                continue
+            amount = self.parse_amount(entry.get("amount_log"))
+            currency_id = self._resolve(self._currencies, entry.get("currency_log"))
+            send_country_id = self._resolve(self._countries, entry.get("send_country_log"))
+            receive_country_id = self._resolve(self._countries, entry.get("receive_country_log"))
+            row = {
+                "user_id": user_id,
+                "url_log": entry["url_log"],
+                "repeat_count": entry.get("repeat_count", 1),
+                "amount": amount,
+                "currency_id": currency_id,
+                "send_country_id": send_country_id,
+                "receive_country_id": receive_country_id,
+                "amount_log": None if amount is not None else entry.get("amount_log"),
+                "currency_log": None if currency_id else entry.get("currency_log"),
+                "send_country_log": None if send_country_id else entry.get("send_country_log"),
+                "receive_country_log": None if receive_country_id else entry.get("receive_country_log"),
+            }
+            if entry.get("created_at"):
+                row["created_at"] = entry["created_at"]
+            rows.append(row)
+        return rows, unknown
+
+
+def readable_logs_select(*extra_columns) -> Select:
+    """
+    Logs with the typed ids turned back into codes (falling back to the legacy strings),
+    so old string logs and new typed ones read the same.
+    Columns: id, created_at, repeat_count, amount, amount_log, send_country, receive_country, currency
+    and `extra_columns`.
+    """
+    currency = Currency.__table__.alias("currency")
+    send_country = Country.__table__.alias("send_country")
+    receive_country = Country.__table__.alias("receive_country")
+    return (
+        select(tg_users_log.c.id, tg_users_log.c.created_at, tg_users_log.c.repeat_count,
+               tg_users_log.c.amount, tg_users_log.c.amount_log,
+               func.coalesce(send_country.c.abbreviation, tg_users_log.c.send_country_log).label("send_country"),
+               func.coalesce(receive_country.c.abbreviation,
+                             tg_users_log.c.receive_country_log).label("receive_country"),
+               func.coalesce(currency.c.abbreviation, tg_users_log.c.currency_log).label("currency"),
+               *extra_columns)
+        .select_from(tg_users_log)
+        .outerjoin(currency, currency.c.id == tg_users_log.c.currency_id)
+        .outerjoin(send_country, send_country.c.id == tg_users_log.c.send_country_id)
+        .outerjoin(receive_country, receive_country.c.id == tg_users_log.c.receive_country_id)
+    )
+
+
+log_compactor = LogCompactor(ttl=settings.cache.objects_cache_sec)
@@ -0,0 +1,103 @@
+import math
+import random
+import time
+from collections import OrderedDict
+
+
+class LogDedupWindow:
+    """
+    Holds every distinct log (user, corridor, currency, amount bucket) for `ttl` seconds before it's written,
+    repeats within the window only increase its `repeat_count` and update it to the latest values.
+    Amounts are bucketed on a log scale, `amount_bucket_pct` apart, so slider drags fall into a few buckets.
+    At most `max_keys` logs are held, the oldest one is pushed out when it's full.
+    """
+    def __init__(self, ttl: float, max_keys: int, amount_bucket_pct: float):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._log_base = math.log1p(amount_bucket_pct / 100) if amount_bucket_pct > 0 else 0
+        # Insertion order is the expiry order, the TTL is the same for everybody
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self.merged = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _amount_bucket(self, amount: str | None):
+        if not amount:
+            return None
+        try:
+            value = float(amount.strip().replace(",", "."))
+        except ValueError:
+            return amount
+        if value <= 0 or not self._log_base or not math.isfinite(value):
+            return value
+        return math.floor(math.log(value) / self._log_base)
+
+    def _key(self, entry: dict) -> tuple:
+        return (entry["tg_user"], entry.get("send_country_log"), entry.get("receive_country_log"),
+                entry.get("currency_log"), self._amount_bucket(entry.get("amount_log")))
+
+    def add(self, entry: dict) -> dict | None:
+        """
+        :return: Log pushed out of the full window, to be written right away
+        """
+        key = self._key(entry)
+        held = self._entries.get(key)
+        if held is not None:
+            _, held_entry = held
+            repeat_count = held_entry["repeat_count"] + entry["repeat_count"]
+            held_entry.update({k: v for k, v in entry.items() if k != "created_at"}, repeat_count=repeat_count)
+            self.merged += 1
+            return None
+
+        self._entries[key] = (time.monotonic() + self.ttl, entry)
+        if len(self._entries) > self.max_keys:
+            return self._entries.popitem(last=False)[1][1]
+        return None
+
+    def pop_expired(self) -> list[dict]:
+        now = time.monotonic()
+        expired = []
+        while self._entries:
+            expires_at, entry = next(iter(self._entries.values()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            expired.append(entry)
+        return expired
+
+    def pop_all(self) -> list[dict]:
+        entries = [entry for _, entry in self._entries.values()]
+        self._entries.clear()
+        return entries
+
+
+class PerUserSampler:
+    """
+    Keeps `rate` of the logs of every user, the `repeat_count` of the dropped ones is carried
+    to the next kept log of the same user. Carried counts are held for at most `max_users` users.
+    """
+    def __init__(self, rate: float, max_users: int):
+        self.rate = rate
+        self.max_users = max_users
+        self._carry: OrderedDict[str, int] = OrderedDict()
+        self.sampled_out = 0
+
+    def keep(self, entry: dict) -> bool:
+        if self.rate >= 1:
+            return True
+        user = entry["tg_user"]
+        if random.random() < self.rate:
+            entry["repeat_count"] += self._carry.pop(user, 0)
+            return True
+
+        self.sampled_out += 1
+        self._carry[user] = self._carry.get(user, 0) + entry["repeat_count"]
+        self._carry.move_to_end(user)
+        if len(self._carry) > self.max_users:
+            self._carry.popitem(last=False)
+        return False
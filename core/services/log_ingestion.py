@@ -0,0 +1,192 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from core import logger, settings
+from core.models import db_pools
+from core.models.tg_logg_user import tg_users_log
+from core.services.log_compaction import log_compactor
+from core.services.log_dedup import LogDedupWindow, PerUserSampler
+
+
+FLUSH_ATTEMPTS = 2
+FLUSH_RETRY_DELAY_SEC = 1
+
+
+class TgUserLogIngestion:
+    """
+    Write-behind ingestion for `tg_users_log`: entries are accepted into a bounded in-memory queue
+    and flushed by a background task with one multi-row INSERT every `flush_interval_ms` or `batch_size` rows,
+    whatever comes first. When the queue (together with the logs released by the dedup window and not written yet)
+    is full `submit` returns False, so the caller can answer 503. Logs of users that aren't registered can't be
+    stored (the endpoint has already answered), they are counted in `unknown_users` and logged once per batch.
+    Entries are stored in the compact typed form, see `LogCompactor`. Repeats are folded by the dedup window
+    and optionally sampled per user before they're queued, `repeat_count` of a row tells how many logs it stands for.
+    """
+    def __init__(self, batch_size: int, flush_interval_ms: float, max_queue_size: int,
+                 dedup: LogDedupWindow, sampler: PerUserSampler):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_queue_size)
+        self.dedup = dedup
+        self.sampler = sampler
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        # Released by the dedup window and not written yet, a burst is written `batch_size` rows at a time
+        self._held: list[dict] = []
+
+        # Metrics
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.unknown_users = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and flush everything left in the queue.
+        """
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def _enqueue(self, entry: dict) -> bool:
+        if not self.sampler.keep(entry):
+            return True
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def submit(self, entry: dict) -> bool:
+        entry.setdefault("created_at", datetime.now(timezone.utc))
+        entry.setdefault("repeat_count", 1)
+        if self.dedup.enabled:
+            # Full queue rejects before the window takes the log, a pushed out log would be lost otherwise
+            if self.queue.full() or self.queue.qsize() + len(self._held) >= self.queue.maxsize:
+                self.rejected += 1
+                return False
+            pushed_out = self.dedup.add(entry)
+            if pushed_out is not None:
+                self._enqueue(pushed_out)
+        elif not self._enqueue(entry):
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def _released(self, limit: int) -> list[dict]:
+        """
+        Logs leaving the dedup window (all of them on shutdown), sampled, at most `limit`; the rest is held back.
+        """
+        entries = self.dedup.pop_all() if self._closing else self.dedup.pop_expired()
+        self._held.extend(entry for entry in entries if self.sampler.keep(entry))
+        batch, self._held = self._held[:limit], self._held[limit:]
+        return batch
+
+    def _drain(self, limit: int) -> list[dict]:
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while not (self._closing and self.queue.empty() and not len(self.dedup) and not self._held):
+            batch = self._released(self.batch_size)
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            await self._flush_with_retry(batch)
+
+    async def _flush_with_retry(self, batch: list[dict]) -> None:
+        """
+        A failed batch (connection lost, timeout) is written once more, then counted in `failed`.
+        """
+        for attempt in range(FLUSH_ATTEMPTS):
+            try:
+                await self._flush(batch)
+                return
+            except Exception as e:
+                if attempt + 1 < FLUSH_ATTEMPTS:
+                    logger.warning("Error flushing %d user logs, retrying: %s", len(batch), e)
+                    await asyncio.sleep(FLUSH_RETRY_DELAY_SEC)
+                else:
+                    self.failed += len(batch)
+                    logger.error("Error flushing %d user logs, dropped: %s", len(batch), e)
+
+    async def _flush(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        async with db_pools.get("background").session_factory() as session:
+            rows, unknown = await log_compactor.compact(session, batch)
+            if rows:
+                await session.execute(insert(tg_users_log).values(rows))
+                await session.commit()
+        written = len(rows)
+        if unknown:
+            self.unknown_users += len(unknown)
+            tg_users = sorted({str(batch[index].get("tg_user")) for index in unknown})
+            logger.warning("Dropped %d logs of unknown users: %s", len(unknown), ", ".join(tg_users[:20]))
+
+        self.batches += 1
+        self.rows_written += written
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_queue_size": self.queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "unknown_users": self.unknown_users,
+            "deduplicated": self.dedup.merged,
+            "dedup_window": len(self.dedup),
+            "held": len(self._held),
+            "sampled_out": self.sampler.sampled_out,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "avg_batch_size": round(self.rows_written / self.batches, 2) if self.batches else 0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+tg_user_log_ingestion = TgUserLogIngestion(
+    batch_size=settings.log_ingestion.batch_size,
+    flush_interval_ms=settings.log_ingestion.flush_interval_ms,
+    max_queue_size=settings.log_ingestion.max_queue_size,
+    dedup=LogDedupWindow(
+        ttl=settings.log_ingestion.dedup_ttl_sec,
+        max_keys=settings.log_ingestion.dedup_max_keys,
+        amount_bucket_pct=settings.log_ingestion.dedup_amount_bucket_pct,
+    ),
+    sampler=PerUserSampler(
+        rate=settings.log_ingestion.sample_rate,
+        max_users=settings.log_ingestion.dedup_max_keys,
+    ),
+)
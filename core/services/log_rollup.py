@@ -0,0 +1,178 @@
+"""
+Incremental rollup of `tg_users_log` into hourly and daily corridor demand buckets.
+Only logs after the stored watermark (last processed log id) are read in id order, up to the first one not older
+than `lag_sec`, so rows still being written by the batched ingestion are picked up by the next run.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from core import logger, settings
+from core.models import tg_log_rollups, tg_log_rollup_watermark
+from core.models.tg_logg_user import tg_users_log
+from core.services.log_compaction import readable_logs_select
+from utils import QuantileSketch
+
+GRANULARITIES = ("hour", "day")
+# Any constant, shared by all workers, so only one of them updates the rollups at a time
+ROLLUP_LOCK_KEY = 7_342_002
+
+
+def bucket_start(created_at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def parse_amount(value) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace(",", ".").replace(" ", ""))
+    except ValueError:
+        return None
+
+
+class RollupBucket:
+    """
+    Aggregate of logs in one (granularity, bucket start, corridor, currency) bucket.
+    """
+    def __init__(self, row=None):
+        self.count = row.count if row else 0
+        self.amount_count = row.amount_count if row else 0
+        self.amount_sum = row.amount_sum if row else 0.0
+        self.amount_min = row.amount_min if row else None
+        self.amount_max = row.amount_max if row else None
+        self.sketch = QuantileSketch.from_dict(row.amount_sketch if row else None)
+
+    def add(self, amount: float | None, count: int = 1) -> None:
+        self.count += count
+        if amount is None:
+            return
+        self.amount_count += count
+        self.amount_sum += amount * count
+        self.amount_min = amount if self.amount_min is None else min(self.amount_min, amount)
+        self.amount_max = amount if self.amount_max is None else max(self.amount_max, amount)
+        self.sketch.add(amount, count)
+
+    def merge(self, other: "RollupBucket") -> None:
+        self.count += other.count
+        self.amount_count += other.amount_count
+        self.amount_sum += other.amount_sum
+        for value in (other.amount_min, other.amount_max):
+            if value is not None:
+                self.amount_min = value if self.amount_min is None else min(self.amount_min, value)
+                self.amount_max = value if self.amount_max is None else max(self.amount_max, value)
+        self.sketch.merge(other.sketch)
+
+
+async def _process_batch(conn: AsyncConnection, last_log_id: int, until: datetime) -> int:
+    """
+    Roll up the next batch of logs after `last_log_id`, in id order up to the first log created at `until` or later.
+    `created_at` isn't increasing with the id (it's set before the logs wait in the ingestion), filtering on it would
+    let the watermark pass logs that are still in the lag window.
+
+    :return: Id of the last processed log, `last_log_id` if there was nothing to process
+    """
+    # Typed ids are rolled up by the code, so old string logs and new typed ones share the buckets
+    result = await conn.execute(
+        readable_logs_select()
+        .where(tg_users_log.c.id > last_log_id)
+        .order_by(tg_users_log.c.id)
+        .limit(settings.rollup.batch_size)
+    )
+    rows = result.all()
+    for i, row in enumerate(rows):
+        if row.created_at >= until:
+            rows = rows[:i]
+            break
+    if not rows:
+        return last_log_id
+
+    buckets: dict[tuple, RollupBucket] = {}
+    for row in rows:
+        amount = float(row.amount) if row.amount is not None else parse_amount(row.amount_log)
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(row.created_at, granularity),
+                   row.send_country or "", row.receive_country or "", row.currency or "")
+            buckets.setdefault(key, RollupBucket()).add(amount, row.repeat_count)
+
+    # Merge with the stored buckets, sketches can't be merged in SQL
+    key_columns = (tg_log_rollups.c.granularity, tg_log_rollups.c.bucket_start, tg_log_rollups.c.send_country,
+                   tg_log_rollups.c.receive_country, tg_log_rollups.c.currency)
+    existing = await conn.execute(
+        select(tg_log_rollups).where(tuple_(*key_columns).in_(list(buckets))).with_for_update()
+    )
+    for row in existing:
+        key = (row.granularity, row.bucket_start, row.send_country, row.receive_country, row.currency)
+        stored = RollupBucket(row)
+        stored.merge(buckets[key])
+        buckets[key] = stored
+
+    values = [
+        {
+            "granularity": key[0], "bucket_start": key[1], "send_country": key[2],
+            "receive_country": key[3], "currency": key[4],
+            "count": bucket.count, "amount_count": bucket.amount_count, "amount_sum": bucket.amount_sum,
+            "amount_min": bucket.amount_min, "amount_max": bucket.amount_max,
+            "amount_sketch": bucket.sketch.to_dict(),
+        }
+        for key, bucket in buckets.items()
+    ]
+    stmt = insert(tg_log_rollups).values(values)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_tg_log_rollups_bucket",
+        set_={column: stmt.excluded[column] for column in (
+            "count", "amount_count", "amount_sum", "amount_min", "amount_max", "amount_sketch"
+        )},
+    )
+    await conn.execute(stmt)
+    return rows[-1].id
+
+
+async def update_rollups(engine: AsyncEngine) -> int:
+    """
+    Process all new logs up to now - lag, batch by batch, every batch in its own transaction
+    together with the watermark update.
+
+    :return: Number of processed batches
+    """
+    until = datetime.now(timezone.utc) - timedelta(seconds=settings.rollup.lag_sec)
+    batches = 0
+    while True:
+        async with engine.begin() as conn:
+            locked = await conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+            if not locked.scalar():
+                return batches
+
+            result = await conn.execute(select(tg_log_rollup_watermark.c.last_log_id)
+                                        .where(tg_log_rollup_watermark.c.id == 1))
+            last_log_id = result.scalar_one_or_none() or 0
+
+            new_last_log_id = await _process_batch(conn, last_log_id, until)
+            if new_last_log_id == last_log_id:
+                return batches
+
+            stmt = insert(tg_log_rollup_watermark).values(id=1, last_log_id=new_last_log_id, updated_at=until)
+            await conn.execute(stmt.on_conflict_do_update(
+                index_elements=["id"], set_={"last_log_id": new_last_log_id, "updated_at": until}
+            ))
+        batches += 1
+
+
+async def run_rollup_job(engine: AsyncEngine) -> None:
+    """
+    Background loop for the app lifespan.
+    """
+    while True:
+        try:
+            batches = await update_rollups(engine)
+            if batches:
+                logger.debug("Rolled up %d batches of user logs", batches)
+        except Exception as e:
+            logger.error("Error in user logs rollup: %s", e)
+        await asyncio.sleep(settings.rollup.interval_sec)
@@ -0,0 +1,108 @@
+"""
+Stdlib sampling profiler for on-demand request profiling. Output is the "folded stacks" format
+(`frame;frame;frame count` per line), which flamegraph.pl, speedscope and inferno read directly.
+"""
+
+import heapq
+import itertools
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+from core import settings
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (the event loop thread by default) from a background thread.
+    Since the loop is shared, samples taken while the profiled request awaits I/O show whatever
+    else the loop was doing at that moment (other requests or the selector).
+    """
+    def __init__(self, interval_ms: float = settings.profiling.sample_interval_ms, thread_id: int | None = None):
+        self.interval = interval_ms / 1000
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    duration_ms: float
+    status_code: int
+    samples: int
+    folded: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round(self.duration_ms, 2),
+            "status_code": self.status_code,
+            "samples": self.samples,
+            "created_at": self.created_at,
+        }
+
+
+class SlowestRequestsStore:
+    """
+    Keeps profiles of the slowest N profiled requests, a min-heap by duration so the fastest
+    stored profile is dropped first.
+    """
+    def __init__(self, size: int = settings.profiling.slowest_store_size):
+        self.size = size
+        self._heap: list[tuple[float, int, RequestProfile]] = []
+        self._counter = itertools.count()
+
+    def add(self, profile: RequestProfile) -> None:
+        item = (profile.duration_ms, next(self._counter), profile)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif profile.duration_ms > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def list(self) -> list[RequestProfile]:
+        return [profile for _, _, profile in sorted(self._heap, key=lambda x: x[0], reverse=True)]
+
+    def get(self, profile_id: str) -> RequestProfile | None:
+        return next((profile for _, _, profile in self._heap if profile.id == profile_id), None)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+slowest_requests_store = SlowestRequestsStore()
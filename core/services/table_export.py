@@ -0,0 +1,93 @@
+"""
+Streaming table exports: rows are read through a server-side cursor in chunks of `chunk_size`
+and every chunk is encoded and sent before the next one is fetched, so memory doesn't grow with the export size.
+"""
+
+import csv
+import io
+from typing import AsyncIterator, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core import settings
+
+
+async def stream_rows(engine: AsyncEngine, stmt: Select) -> AsyncIterator[Sequence]:
+    """
+    :return: Chunks of rows from a server-side cursor, the connection lives as long as the iteration
+    """
+    chunk_size = settings.export.chunk_size
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions(chunk_size):
+            yield rows
+
+
+async def csv_chunks(columns: list[str], chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file for ParquetWriter, hands out what was written so far while keeping the position
+    (Parquet footer stores absolute offsets).
+    """
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def pop(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def parquet_chunks(columns: dict[str, str], chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    """
+    Every chunk of rows is written as one Parquet row group.
+
+    :param columns: Column name -> type: int, bool, str, decimal or datetime
+    :param chunks: Chunks of rows with the columns in the same order
+    """
+    types = {
+        "int": pa.int64(),
+        "bool": pa.bool_(),
+        "str": pa.string(),
+        "decimal": pa.decimal128(18, 2),
+        "datetime": pa.timestamp("us", tz="UTC"),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in columns.items()])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in chunks:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.pop()
+    finally:
+        writer.close()
+    yield sink.pop()
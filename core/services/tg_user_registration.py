@@ -0,0 +1,40 @@
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import TgUser
+
+
+async def upsert_tg_user(
+        session: AsyncSession,
+        tg_user: str,
+        username: str | None = None,
+        overwrite_username: bool = False,
+        reactivate: bool = False,
+) -> tuple[TgUser, bool]:
+    """
+    Create a Telegram user or update the existing one in one statement
+    (INSERT ... ON CONFLICT (tg_user) DO UPDATE ... RETURNING), safe under concurrent registration.
+    Used by both the API and the bot. The caller commits.
+
+    :param session: Async database session
+    :param tg_user: Telegram chat id
+    :param username: Telegram username
+    :param overwrite_username: Set username even if it's None (bot knows the actual one), otherwise keep the stored one
+    :param reactivate: Mark the user reachable again (they wrote to the bot, so it isn't blocked anymore)
+    :return: User and True if it was created
+    """
+    stmt = insert(TgUser).values(tg_user=tg_user, username=username, is_superuser=False)
+    new_username = stmt.excluded.username if overwrite_username else func.coalesce(stmt.excluded.username,
+                                                                                    TgUser.username)
+    set_ = {"username": new_username}
+    if reactivate:
+        set_["status"] = "active"
+    stmt = (
+        stmt.on_conflict_do_update(index_elements=[TgUser.tg_user], set_=set_)
+        # xmax is 0 only for a freshly inserted row version
+        .returning(TgUser, literal_column("(xmax = 0)").label("created"))
+    )
+    result = await session.execute(stmt, execution_options={"populate_existing": True})
+    user, created = result.one()
+    return user, created
@@ -0,0 +1,151 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core import settings, logger
+
+
+# Set by the HTTP middleware, so every recorded statement knows which route issued it
+current_route: ContextVar[str | None] = ContextVar("current_route", default=None)
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_bind_param = re.compile(r"\$\d+|%\(\w+\)s|(?<!:):(?!:)\w+")
+_value_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_whitespace = re.compile(r"\s+")
+# Statements ANALYZE can't run again safely: row locks, and side effects of functions
+_locking_clause = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b")
+_side_effect_function = re.compile(r"\b(?:nextval|setval|pg_(?:try_)?advisory\w*)\s*\(", re.IGNORECASE)
+_from_clause = re.compile(r"\bFROM\b")
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Strip literals and bind params from the statement, so the same query with different values
+    is grouped together: `WHERE id IN ($1, $2, $3)` -> `WHERE id IN (?, ...)`.
+    """
+    sql = _string_literal.sub("?", statement)
+    sql = _bind_param.sub("?", sql)
+    sql = _number_literal.sub("?", sql)
+    sql = _value_list.sub("(?, ...)", sql)
+    return _whitespace.sub(" ", sql).strip()
+
+
+def is_explainable(sql: str) -> bool:
+    """
+    Plain reads only: a SELECT from tables, without a locking clause or functions with side effects.
+
+    :param sql: Normalized statement
+    """
+    upper = sql.upper()
+    return (upper.startswith("SELECT") and _from_clause.search(upper) is not None
+            and _locking_clause.search(upper) is None and _side_effect_function.search(sql) is None)
+
+
+def parameters_shape(parameters) -> list[str]:
+    if parameters is None:
+        return []
+    if isinstance(parameters, dict):
+        parameters = parameters.values()
+    shape = []
+    for value in parameters:
+        if isinstance(value, (list, tuple)):
+            shape.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            shape.append(type(value).__name__)
+    return shape
+
+
+@dataclass
+class SlowQuery:
+    sql: str
+    parameters: list[str]
+    duration_ms: float
+    route: str | None
+    explain: str | None = None
+    created_at: float = field(default_factory=time.time)
+
+
+class SlowQueryLog:
+    """
+    Records statements slower than the threshold into a ring buffer. For a sampled part of slow SELECTs
+    `EXPLAIN (ANALYZE, BUFFERS)` is run in the background on a separate connection and stored with the record.
+    Only plain SELECTs are explained (see `is_explainable`), because ANALYZE actually executes the statement.
+    EXPLAIN runs on the engine that executed the statement.
+    """
+    def __init__(self, threshold_ms: float, explain_sample_rate: float, buffer_size: int):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.records: deque[SlowQuery] = deque(maxlen=buffer_size)
+        self._engines: dict[Engine, AsyncEngine] = {}
+        self._explain_tasks: set[asyncio.Task] = set()
+
+    def install(self, engine: AsyncEngine) -> None:
+        self._engines[engine.sync_engine] = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine.sync_engine, "handle_error", self._handle_error)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(exception_context):
+        # after_cursor_execute isn't called for failed statements
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+        if duration_ms < self.threshold_ms or statement.lstrip().upper().startswith("EXPLAIN"):
+            return
+
+        record = SlowQuery(
+            sql=normalize_sql(statement),
+            parameters=parameters_shape(parameters),
+            duration_ms=round(duration_ms, 2),
+            route=current_route.get(),
+        )
+        self.records.append(record)
+        logger.warning("Slow query (%.2f ms) on route %s: %s", record.duration_ms, record.route, record.sql)
+
+        engine = self._engines.get(conn.engine)
+        if (engine is not None and not executemany and is_explainable(record.sql)
+                and random.random() < self.explain_sample_rate):
+            try:
+                task = asyncio.get_running_loop().create_task(self._explain(engine, record, statement, parameters))
+            except RuntimeError:
+                return
+            self._explain_tasks.add(task)
+            task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, engine: AsyncEngine, record: SlowQuery, statement: str, parameters) -> None:
+        try:
+            async with engine.connect() as conn:
+                result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                record.explain = "\n".join(row[0] for row in result)
+                await conn.rollback()
+        except Exception as e:
+            logger.error("Error running EXPLAIN for slow query: %s", e)
+
+    def list(self) -> list[SlowQuery]:
+        return sorted(self.records, key=lambda x: x.created_at, reverse=True)
+
+    def clear(self) -> None:
+        self.records.clear()
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query.threshold_ms,
+    explain_sample_rate=settings.slow_query.explain_sample_rate,
+    buffer_size=settings.slow_query.buffer_size,
+)
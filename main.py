@@ -1,38 +1,31 @@
+import time
+_started_at = time.perf_counter()  # Taken before the app imports, for the import-time report
+
+import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 import logging
 
 from fastapi import FastAPI, Response, Request
-from fastapi.responses import ORJSONResponse, JSONResponse
+from fastapi.responses import ORJSONResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 import uvicorn
 
-from sqladmin import Admin
 from sqlalchemy.exc import IntegrityError
 
 from core import settings
 from core import logger
-from core.models import db_helper, check_and_update_tables, WelcomeMessage
+from core.models import db_helper, db_pools, ensure_schemas, tg_logs_schema, welcome_message_schema
 from api import api_router
-
-from core.admin.models import (
-    CountryAdmin,
-    CurrencyAdmin,
-    DocumentAdmin,
-    TransferProviderAdmin,
-    TransferRuleAdmin,
-    ProviderExchangeRateAdmin,
-    TgUserAdmin,
-    TgUserLogAdmin,
-    WelcomeMessageAdmin,
-)
-from core.admin import (
-    sqladmin_authentication_backend,
-    async_sqladmin_db_helper,
+from core.services import (
+    SamplingProfiler, RequestProfile, slowest_requests_store, tg_user_log_ingestion, run_rollup_job,
 )
-from core.models.tg_welcome_message import check_table
+from core.models.tg_log_partitions import run_partition_maintenance
+from core.models.tg_log_backfill import run_compact_backfill
+from core.slow_query_log import current_route
+from utils.import_report import import_report
 
 
 @asynccontextmanager
@@ -40,24 +33,38 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Startup
     logger.info("Starting up the FastAPI application...")
 
-    # TG logging tables creation
+    # TG logging and welcome message tables, one query unless their schema version changed
     engine = db_helper.engine
 
     try:
-        logger.info("Checking if logging tables exist...")
-        await check_and_update_tables(engine)
-
-        # Welcome message for TG bot
-        await check_table(engine)
+        await ensure_schemas(engine, tg_logs_schema, welcome_message_schema)
     except Exception as e:
         logger.exception(f"Error in lifespan on table hand writen creation/update (no auto migration tables with ): {e}")
 
+    # Write-behind user logs
+    tg_user_log_ingestion.start()
+
+    # Old user logs to the typed compact columns, no-op once converted
+    compact_backfill = asyncio.create_task(run_compact_backfill(db_pools.get("background").engine))
+
+    # Upcoming log partitions and retention
+    partition_maintenance = asyncio.create_task(run_partition_maintenance(db_pools.get("background").engine))
+
+    # Corridor demand rollups from user logs
+    rollup_job = asyncio.create_task(run_rollup_job(db_pools.get("background").engine))
+
+    if settings.run.import_report:
+        logger.warning("Worker ready", extra={"mode": settings.run.mode, **import_report(_started_at)})
+
     yield
 
     # Shutdown
     logger.info("Shutting down the FastAPI application...")
-    await db_helper.dispose()
-    await async_sqladmin_db_helper.dispose()  # Admin db engine dispose
+    compact_backfill.cancel()
+    partition_maintenance.cancel()
+    rollup_job.cancel()
+    await tg_user_log_ingestion.stop()  # Flush queued user logs before the pools are closed
+    await db_pools.dispose()  # API, admin and any other opened pools
 
 
 # ORJSONResponse to increase performance
@@ -77,18 +84,10 @@ main_app.add_middleware(
     allow_headers=["*"],
 )
 
-# SQLAdmin
-admin = Admin(main_app, engine=async_sqladmin_db_helper.engine, authentication_backend=sqladmin_authentication_backend)
-
-admin.add_view(CurrencyAdmin)
-admin.add_view(CountryAdmin)
-admin.add_view(DocumentAdmin)
-admin.add_view(TransferProviderAdmin)
-admin.add_view(ProviderExchangeRateAdmin)
-admin.add_view(TransferRuleAdmin)
-admin.add_view(TgUserAdmin)
-admin.add_view(TgUserLogAdmin)
-admin.add_view(WelcomeMessageAdmin)
+# SQLAdmin, API-only workers ("api" mode) skip it with all of its imports
+if settings.run.mode == "full":
+    from core.admin.setup import setup_admin
+    admin = setup_admin(main_app)
 
 main_app.include_router(router=api_router, prefix=settings.api_prefix.prefix)
 
@@ -132,6 +131,56 @@ async def catch_exceptions_middleware(request: Request, call_next):
         )
 
 
+# Route is attached to slow query log records
+@main_app.middleware("http")
+async def route_context_middleware(request: Request, call_next):
+    current_route.set(f"{request.method} {request.url.path}")
+    return await call_next(request)
+
+
+# On-demand profiling, only for requests with a valid admin session
+@main_app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    if not settings.profiling.enabled:
+        return await call_next(request)
+
+    mode = (request.headers.get(settings.profiling.header)
+            or request.query_params.get(settings.profiling.query_param))
+    if not mode:
+        return await call_next(request)
+
+    from core.admin import is_admin_request  # Not loaded at all unless profiling is requested
+    if not await is_admin_request(request):
+        return await call_next(request)
+
+    profiler = SamplingProfiler()
+    profiler.start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    duration_ms = (time.perf_counter() - start) * 1000
+
+    profile = RequestProfile(
+        method=request.method,
+        path=request.url.path,
+        duration_ms=duration_ms,
+        status_code=response.status_code,
+        samples=profiler.samples,
+        folded=profiler.folded(),
+    )
+    slowest_requests_store.add(profile)
+    logger.warning(f"Profiled {profile.method} {profile.path}: {duration_ms:.2f} ms, {profile.samples} samples")
+
+    headers = {"X-Profile-Id": profile.id, "X-Profile-Duration-Ms": f"{duration_ms:.2f}"}
+    # "return" sends back the folded stacks instead of the response, any other value only stores the profile
+    if mode == "return":
+        return PlainTextResponse(profile.folded, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
 class NoFaviconFilter(logging.Filter):
     def filter(self, record):
         return not any(x in record.getMessage() for x in ['favicon.ico', 'apple-touch-icon'])
@@ -1,4 +1,6 @@
-__all__ = ["camel_case_to_snake_case", "Ordering"]
+__all__ = ["camel_case_to_snake_case", "Ordering", "make_queue_handler", "QuantileSketch"]
 
 from .camel_case_to_snake_case import camel_case_to_snake_case
 from .ordering import Ordering
+from .queue_logging import make_queue_handler
+from .quantile_sketch import QuantileSketch
@@ -0,0 +1,24 @@
+"""
+Import-time report for worker startup: how long it took to become ready, how many modules are loaded
+and which of the heavy optional parts (admin panel, bot) got imported.
+"""
+
+import resource
+import sys
+import time
+
+WATCHED_MODULES = ("sqladmin", "wtforms", "wtforms_components", "aiogram", "bot", "core.admin")
+
+
+def import_report(started_at: float) -> dict:
+    """
+    :param started_at: time.perf_counter() value taken before the app imports
+    :return: Report dict, ready for logging
+    """
+    return {
+        "startup_ms": round((time.perf_counter() - started_at) * 1000, 2),
+        "modules_loaded": len(sys.modules),
+        "watched_modules_loaded": [name for name in WATCHED_MODULES if name in sys.modules],
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
@@ -0,0 +1,59 @@
+"""
+Small mergeable quantile sketch (DDSketch-style log buckets): every value is counted in a bucket
+whose width grows with the value, so any quantile is estimated with `relative_accuracy` relative error.
+Sketches of different buckets (hours, days, corridors) are merged by adding bucket counts.
+"""
+
+import math
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01, buckets: dict[int, int] | None = None, zero_count: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = buckets or {}
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> float | None:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {"a": self.relative_accuracy, "z": self.zero_count, "b": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "QuantileSketch":
+        if not data:
+            return cls()
+        return cls(
+            relative_accuracy=data.get("a", 0.01),
+            buckets={int(k): v for k, v in data.get("b", {}).items()},
+            zero_count=data.get("z", 0),
+        )
@@ -0,0 +1,124 @@
+"""
+Non-blocking logging: records are put on a bounded queue by the calling (event loop) thread and formatted
+and written by a background listener thread. Sampling is done before enqueueing, so noisy hot-path messages
+cost only a dict lookup when they are over the limit.
+"""
+
+import atexit
+import copy
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most `limit` records per `interval` seconds for every message type, where message type is
+    (logger name, level, message template). Records at `always_level` or above are never sampled.
+    Number of suppressed records is attached to the next passed record of the same type as `sampled_suppressed`.
+    Windows that ended are pruned every `interval`, at most `max_windows` message types are tracked (the others
+    pass unsampled until there is room).
+    """
+    def __init__(self, limit: int, interval: float, always_level: int = logging.WARNING, max_windows: int = 10_000):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.always_level = always_level
+        self.max_windows = max_windows
+        self._windows: dict[tuple, list] = {}  # key -> [window start, passed, suppressed]
+        self._next_prune_at = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        # Suppressed counts of ended windows are kept one more interval for the next record of the type
+        self._windows = {
+            key: window for key, window in self._windows.items()
+            if now - window[0] < (2 * self.interval if window[2] else self.interval)
+        }
+        self._next_prune_at = now + self.interval
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level or self.limit <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_prune_at:
+                self._prune(now)
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                if window is not None or len(self._windows) < self.max_windows:
+                    self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.sampled_suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Unlike the stdlib QueueHandler this one doesn't run the formatter in the calling thread, only `msg % args`
+    of the records that passed sampling (the args may be ORM objects, not to be read from the listener thread);
+    the listener thread does the rest. The calling thread never waits: when the queue is full records of any level
+    are dropped and counted, the count is logged as a warning once there is room again.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not record.args:
+            return record
+        # A copy, other handlers of the logger get the original record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+        if self._unreported:
+            unreported, self._unreported = self._unreported, 0
+            warning = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                        "%s log records dropped, the log queue was full", (unreported,), None)
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self._unreported += unreported
+
+
+def make_queue_handler(handler: logging.Handler, queue_size: int,
+                       sample_limit: int, sample_interval: float) -> LazyQueueHandler:
+    """
+    Wrap a (blocking) handler into a queue handler with a background writer thread.
+
+    :param handler: Handler that actually writes records, runs in the listener thread
+    :param queue_size: Max records waiting to be written
+    :param sample_limit: Max records per message type per interval, 0 disables sampling
+    :param sample_interval: Sampling interval in seconds
+    :return: Handler to attach to the logger
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(limit=sample_limit, interval=sample_interval))
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    # Flush what's left in the queue on interpreter exit
+    atexit.register(listener.stop)
+
+    return queue_handler